@@ -0,0 +1,113 @@
+"""
+Frame Utilities
+DataFrame helpers shared by the switch extraction engine (switch_engine.py) and the
+KYC mis-selling engine (kyc_engine.py).
+"""
+
+import numpy as np
+import pandas as pd
+
+def map_codes(codes, uniques, func, na_value=np.nan):
+    """
+    Apply func to each of the uniques of a pd.factorize result and broadcast the results back
+    through its codes. Missing entries (code -1) get na_value without calling func. Returns an
+    ndarray: bool when every result is a bool, object otherwise.
+    """
+    results = np.empty(len(uniques) + 1, dtype=object)
+    for i, value in enumerate(uniques):
+        results[i] = func(value)
+    # The last slot is picked by the -1 code of missing entries
+    results[-1] = na_value
+    if all(isinstance(result, (bool, np.bool_)) for result in results):
+        results = results.astype(bool)
+    return results[codes]
+
+def map_distinct(values, func, na_value=np.nan):
+    """
+    Apply func to each distinct value of a Series and broadcast the results back to its rows.
+    Missing entries get na_value without calling func. Meant for string predicates and
+    normalizations on repetitive columns, e.g. a few hundred scheme names over millions of rows.
+    The result is a bool Series for predicates and an object Series otherwise.
+    """
+    codes, uniques = pd.factorize(values)
+    return pd.Series(map_codes(codes, uniques, func, na_value), index=values.index)
+
+def upper_header(col):
+    return str(col).upper()
+
+def read_columns(file_path, columns=None, dtype=None, normalize=upper_header, **kwargs):
+    """
+    Read a CSV or Excel file, parsing only the columns whose normalized header is in columns
+    (every column when None), with dtype hints keyed by normalized header. A header-only read
+    first maps the wanted names to the file's own spelling, so headers still match
+    case-insensitively; the returned frame has normalized headers.
+    """
+    reader = pd.read_csv if str(file_path).lower().endswith('.csv') else pd.read_excel
+    header = reader(file_path, nrows=0, **kwargs).columns
+    usecols = [col for col in header if columns is None or normalize(col) in columns]
+    hints = {col: dtype[normalize(col)] for col in usecols if dtype and normalize(col) in dtype}
+    frame = reader(file_path, usecols=usecols, dtype=hints or None, **kwargs)
+    frame.columns = [normalize(col) for col in frame.columns]
+    return frame
+
+def column_width(values, header, padding=2, max_width=40):
+    """
+    Excel column width that fits the header and the longest non-missing value as text,
+    plus padding and capped at max_width. String lengths are taken in one vectorized
+    astype(str).str.len() pass instead of a Python loop over the cells.
+    """
+    values = values.dropna()
+    longest = int(values.astype(str).str.len().max()) if len(values) else 0
+    return min(max(len(str(header)), longest) + padding, max_width)
+
+def frame_column_widths(frame, headers=None, padding=2, max_width=40, sample_rows=None):
+    """
+    column_width for every column of a DataFrame, in order; headers default to the column names.
+    With sample_rows only the first that many rows are measured, which bounds the cost on long frames.
+    """
+    headers = frame.columns if headers is None else headers
+    if sample_rows is not None:
+        frame = frame.iloc[:sample_rows]
+    return [column_width(frame.iloc[:, i], header, padding, max_width) for i, header in enumerate(headers)]
+
+EXPORT_FORMATS = ('parquet', 'csv')
+
+def parquet_ready(frame):
+    """
+    Copy of a DataFrame that Parquet can store: object columns mixing value types (e.g. trail
+    rates read as numbers in some sheets and as text in others) are written as text.
+    """
+    frame = frame.copy()
+    for col in frame.columns[frame.dtypes == object]:
+        if pd.api.types.infer_dtype(frame[col], skipna=True) not in ('string', 'floating', 'integer', 'mixed-integer-float', 'boolean', 'datetime', 'date', 'empty'):
+            frame[col] = map_distinct(frame[col], str)
+    return frame
+
+def export_frames(frames, output_base, formats=('parquet',)):
+    """
+    Write each frame of a {suffix: DataFrame} dict to '<output_base><suffix>.<format>' for every
+    requested format ('parquet' and/or 'csv') and return the written paths. Parquet needs
+    pyarrow or fastparquet; without them the frames are written as CSV instead.
+    """
+    formats = list(dict.fromkeys(formats))
+    unknown = [fmt for fmt in formats if fmt not in EXPORT_FORMATS]
+    if unknown:
+        raise ValueError(f"Unknown export format(s) {', '.join(unknown)}, expected {', '.join(EXPORT_FORMATS)}")
+
+    written = []
+    for suffix, frame in frames.items():
+        for fmt in formats:
+            path = f"{output_base}{suffix}.{fmt}"
+            if fmt == 'parquet':
+                try:
+                    parquet_ready(frame).to_parquet(path, index=False)
+                except ImportError as e:
+                    print(f"Parquet export not available ({e}), writing CSV instead...")
+                    if 'csv' in formats:
+                        continue
+                    path = f"{output_base}{suffix}.csv"
+                    frame.to_csv(path, index=False)
+            else:
+                frame.to_csv(path, index=False)
+            written.append(path)
+    return written
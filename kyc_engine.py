@@ -0,0 +1,712 @@
+"""
+KYC Mis-selling Engine
+The GUI-free pipeline behind the Miss_Selling Processing System: reads the investor master,
+RTA master and AMFI NAV files, enriches the investor data, runs the mis-selling checks and
+writes the 'Main Data' / 'Checks Info' workbook.
+Run it directly for unattended batch jobs (python kyc_engine.py --help).
+"""
+
+import argparse
+import os
+import re
+import sys
+import numpy as np
+import pandas as pd
+from frame_utils import EXPORT_FORMATS, export_frames, frame_column_widths, map_codes, map_distinct, read_columns
+
+# Constants
+REQUIRED_INVESTOR_COLS = ['SCHEME', 'PURCHASEUNITS', 'TRDATE', 'DOB']
+REQUIRED_RTA_COLS = ['SCHEME', 'ISIN', 'OPTDESC']
+REQUIRED_AMFI_COLS = ['ISIN DIV PAYOUT/ISIN GROWTH', 'ISIN DIV REINVESTMENT', 'NET ASSET VALUE']
+
+# Only these RTA / AMFI columns are parsed. Scheme codes and ISINs are join keys and always read
+# as text; units and NAVs are left to inference since AMFI lists 'N.A.' for some schemes and the
+# valuation coerces them anyway
+RTA_COLS = REQUIRED_RTA_COLS + ['SCHEMEDESC']
+INVESTOR_DTYPES = {'SCHEME': str}
+RTA_DTYPES = {'SCHEME': str, 'ISIN': str}
+AMFI_DTYPES = {'ISIN DIV PAYOUT/ISIN GROWTH': str, 'ISIN DIV REINVESTMENT': str}
+
+# TRDATE/DOB are written as real dates in this display format
+EXCEL_DATE_FORMAT = 'dd-mm-yyyy'
+
+ADITYA_FUNDS = [
+      'MIDCAP FUND',
+    'CONTRA FUND',
+    'MANUFACTURING FUND',
+    'FLEXI CAP FUND',
+    'LARGE & MID CAP FUND',
+    'MULTICAP FUND',
+    'SMALL CAP FUND',
+    'LARGECAP FUND',
+    'INFRASTRUCTURE FUND',
+    'FINANCIAL SERVICES FUND',
+    'ELSS TAX SAVER FUND',
+    'LARGE CAP FUND',
+    'MID CAP FUND',
+    'FRONTLINE EQUITY FUND',
+    'FOCUSED FUND',
+    'EQUITY ADVANTAGE FUND',
+    'MNC FUND',
+    'MULTI-CAP FUND',
+    'PURE VALUE FUND',
+    'MANUFACTURING EQUITY FUND',
+    'BANKING AND FINANCIAL SERVICES FUND',
+    'DIVIDEND YIELD FUND',
+    'DIGITAL INDIA FUND',
+    'INDIA GENNEXT FUND',
+    'INTERNATIONAL EQUITY FUND',
+    'PHARMA & HEALTHCARE FUND',
+    'BAL BHAVISHYA YOJNA',
+    'RETIREMENT FUND - THE 30S PLAN',
+    'RETIREMENT FUND - THE 40S PLAN',
+    'RETIREMENT FUND - THE 50S PLAN',
+    'PSU EQUITY FUND',
+    'SPECIAL OPPORTUNITIES FUND',
+    'ESG INTEGRATION STRATEGY FUND',
+    'BUSINESS CYCLE FUND',
+    'TRANSPORTATION AND LOGISTICS FUND',
+    'QUANT FUND',
+    'ADITYA CONGLOMERATE FUND',
+    'ELSS TAX SAVER FUND'
+]
+
+# Mis-selling rules, in output column order. Each rule is compiled to boolean masks over the whole
+# investor frame and the row is flagged 'Check' only when every condition in the rule holds:
+#   arn             'not_direct'      ARNNAME present and not containing DIRECT
+#                   'not_direct_or_missing'  ARNNAME missing or not containing DIRECT
+#                   'not_exactly_direct'     ARNNAME (trimmed) is not exactly DIRECT
+#   scheme_any      SCHEMEDESC contains one of these names (a str names the KYCEngine list to use)
+#   scheme_none     SCHEMEDESC contains none of these names
+#   stat_any        STATDESC contains one of these names
+#   occupation_any  OCCUPATION_DESCRIPTION contains one of these names
+#   min_age         AGE AT TRANSACTION >= min_age
+#   min_valuation   VALUATION OF INVESTOR >= min_valuation
+#   income_multiple VALUATION OF INVESTOR >= income_multiple x upper value of INCOMESLAB
+# 'color' is the fill used for flagged cells in the Checks Info sheet.
+KYC_RULES = [
+    {
+        'column': 'Investment in Small Cap Equity Schemes after Age 80',
+        'arn': 'not_direct', 'scheme_any': ['SMALL CAP'], 'min_age': 80,
+        'color': 'FFC7CE'  # Light Red
+    },
+    {
+        'column': 'Investment in ELSS Tax Saver Fund Equity Schemes after Age 80',
+        'arn': 'not_direct', 'scheme_any': ['ELSS'], 'min_age': 80,
+        'color': 'FFEB9C'  # Light Yellow
+    },
+    {
+        'column': 'Investment 10x the given INCOMESLAB',
+        'arn': 'not_exactly_direct', 'income_multiple': 10,
+        'color': 'C6EFCE'  # Light Green
+    },
+    {
+        'column': 'Investment of 50 lakhs or higher HOUSEHOLD,FARMER,LABOUR',
+        'arn': 'not_direct_or_missing', 'occupation_any': ['HOUSEHOLD', 'FARMER', 'LABOUR'], 'min_valuation': 5000000,
+        'color': 'B4C6E7'  # Light Blue
+    },
+    {
+        'column': 'Investment in Mid Cap Fund Equity Schemes after Age 80',
+        'arn': 'not_direct', 'scheme_any': ['MID CAP'], 'scheme_none': ['LARGE & MID CAP'], 'min_age': 80,
+        'color': 'F4B084'  # Light Orange
+    },
+    {
+        'column': 'AOP/society making investments in equity',
+        'arn': 'not_direct', 'stat_any': ['TRUST', 'SOCIETY', 'CLUB'], 'scheme_any': ADITYA_FUNDS,
+        'color': 'D9E1F2'  # Light Purple
+    },
+    {
+        'column': 'Allocation to Underperfoming scheme / execption scheme - Greater than 10 lakhs - Individual Investor',
+        'scheme_any': 'underperforming_schemes', 'stat_any': ['INDIVIDUAL'], 'min_valuation': 1000000,  # 10 lakhs
+        'color': 'E2EFDA'  # Light Mint
+    },
+    {
+        'column': 'Credit Risk Fund Above 80 - INDIVIDUAL INVESTOR',
+        'scheme_any': 'credit_risk_funds', 'stat_any': ['INDIVIDUAL'], 'min_age': 80,
+        'color': 'FFD9D9'  # Light Pink
+    }
+]
+
+def convert_income_slab_to_number(income_slab):
+    """Return the upper value in rupees of an INCOMESLAB such as '5 Lakh - 10 Lakh', or None."""
+    if pd.isna(income_slab):
+        return None
+    slab = str(income_slab)
+    slab = slab.replace('–', '-').replace('—', '-').replace('−', '-')
+    slab = '-'.join([s.strip() for s in slab.split('-')]).lower()
+    if '1 lakh' in slab and '5 lakh' in slab:
+        return 500000
+    elif '5 lakh' in slab and '10 lakh' in slab:
+        return 1000000
+    elif '10 lakh' in slab and '25 lakh' in slab:
+        return 2500000
+    elif '25 lakh' in slab and '1 crore' in slab:
+        return 10000000
+    return None
+
+class NameMatcher:
+    """Finds which of a list of names occurs in each text, searching each distinct text only once."""
+
+    def __init__(self, names):
+        self.names = list(dict.fromkeys(names))
+        # One alternation regex; longest names first so overlapping names report the most specific one
+        alternatives = sorted(self.names, key=len, reverse=True)
+        self.pattern = re.compile('|'.join(re.escape(name) for name in alternatives)) if self.names else None
+
+    def matches(self, codes, uniques):
+        """Object array with the leftmost name found in each row of a factorized upper-cased text column (NaN where none)."""
+        if self.pattern is None:
+            return np.full(len(codes), np.nan, dtype=object)
+        return map_codes(codes, uniques, self.find)
+
+    def contains(self, codes, uniques):
+        """Boolean array: which rows of a factorized upper-cased text column contain any of the names (missing -> False)."""
+        if self.pattern is None:
+            return np.zeros(len(codes), dtype=bool)
+        return map_codes(codes, uniques, lambda value: self.pattern.search(value) is not None, na_value=False)
+
+    def find(self, value):
+        """The leftmost name found in one upper-cased text, or NaN."""
+        match = self.pattern.search(value)
+        return match.group(0) if match else np.nan
+
+def contains_any(codes, uniques, names):
+    """Boolean array: which rows of a factorized upper-cased text column contain any of names (missing -> False)."""
+    return NameMatcher(names).contains(codes, uniques)
+
+def parse_name_list(text):
+    """Split a comma separated list of scheme/fund names into stripped, upper-case names."""
+    if not text:
+        return []
+    if isinstance(text, str):
+        text = text.split(',')
+    return [name.strip().upper() for name in text if name.strip()]
+
+class KYCEngine:
+    """Runs the KYC mis-selling checks and writes their output, without any GUI."""
+    # 'cells' fills each flagged 'Check' cell as it is written; 'conditional' writes plain data
+    # and fills them through one conditional-format rule per Checks Info block
+    HIGHLIGHT_MODES = ('cells', 'conditional')
+    # Main Data widths are fitted to this many leading rows; Checks Info blocks are small and fully measured
+    WIDTH_SAMPLE_ROWS = 1000
+
+    def __init__(self, investor_file_path, rta_file_path, amfi_file_path,
+                 underperforming_schemes=None, credit_risk_funds=None, highlight_mode='cells', progress=None,
+                 rta_df=None, amfi_df=None):
+        if highlight_mode not in self.HIGHLIGHT_MODES:
+            raise ValueError(f"Unknown highlight mode '{highlight_mode}', expected one of {', '.join(self.HIGHLIGHT_MODES)}")
+        self.investor_file_path = investor_file_path
+        self.rta_file_path = rta_file_path
+        self.amfi_file_path = amfi_file_path
+        # Scheme/fund names to flag; a comma separated string or a list of names
+        self.underperforming_schemes = parse_name_list(underperforming_schemes)
+        self.credit_risk_funds = parse_name_list(credit_risk_funds)
+        self.highlight_mode = highlight_mode
+        # Progress callback taking (fraction done, status text), e.g. LoadingWindow.update_progress
+        self.progress = progress or (lambda value, status_text: None)
+
+        self.investor_df = None
+        # Masters already read with read_columns (e.g. shared by a batch of investor files); read from the paths when None
+        self.rta_df = rta_df
+        self.amfi_df = amfi_df
+        self.matched_schemes = {}  # Check column -> scheme name from its list found in each row's SCHEMEDESC
+        self.check_flags = None  # Boolean matrix of investor rows x KYC_RULES, True where the rule flagged the row
+        self._text_columns = {}  # Column -> factorized upper-cased text (codes, uniques), only kept while the checks run
+
+    def run(self):
+        """Read the files, run all checks and return the processed investor DataFrame."""
+        self._read_files()
+        self._perform_kyc_checks()
+        return self.investor_df
+
+    def _read_files(self):
+        """Read and validate the uploaded files."""
+        self.progress(0.1, "Reading files...")
+            
+        # Read files (column names are matched and returned in uppercase); every investor
+        # column goes to the output, the masters are cut down to the columns used
+        self.investor_df = read_columns(self.investor_file_path, dtype=INVESTOR_DTYPES)
+        if self.rta_df is None:
+            self.rta_df = read_columns(self.rta_file_path, RTA_COLS, dtype=RTA_DTYPES)
+        if self.amfi_df is None:
+            self.amfi_df = read_columns(self.amfi_file_path, REQUIRED_AMFI_COLS, dtype=AMFI_DTYPES)
+            
+        # Validate required columns
+        self._validate_required_columns()
+        
+        # Filter out specific schemes
+        self.investor_df = self.investor_df[~self.investor_df['SCHEME'].str.contains('LF|ON|AF', case=False, na=False)]
+            
+    def _validate_required_columns(self):
+        """Validate that all required columns are present in the files."""
+        for col in REQUIRED_INVESTOR_COLS:
+            if col not in self.investor_df.columns:
+                raise ValueError(f"Column '{col}' not found in Investor Master KYC file")
+            
+        for col in REQUIRED_RTA_COLS:
+            if col not in self.rta_df.columns:
+                raise ValueError(f"Column '{col}' not found in RTA Master file")
+            
+        for col in REQUIRED_AMFI_COLS:
+            if col not in self.amfi_df.columns:
+                raise ValueError(f"Column '{col}' not found in AMFI NAV Data file")
+    def _perform_kyc_checks(self):
+        """Perform all KYC verification checks."""
+        self.progress(0.3, "Processing data...")
+            
+        # Convert dates
+        self._convert_dates()
+        
+        # Calculate age
+        self._calculate_age()
+        
+        # Add ISIN, OPTDESC, SCHEMEDESC, NAV and valuation
+        self._add_scheme_and_nav_details()
+        
+        # Perform specific checks
+        self._perform_specific_checks()
+        
+    def _convert_dates(self):
+        """Convert date columns to datetime format."""
+        self.investor_df['TRDATE'] = pd.to_datetime(self.investor_df['TRDATE'], errors='coerce')
+        self.investor_df['DOB'] = pd.to_datetime(self.investor_df['DOB'], errors='coerce')
+            
+    def _calculate_age(self):
+        """Calculate age at the end of transaction month."""
+        month_end = self.investor_df['TRDATE'] + pd.offsets.MonthEnd(0)
+        dob = self.investor_df['DOB']
+
+        # Date components as float arrays; NaT in either date gives NaN and so a missing age
+        def components(dates):
+            return [getattr(dates.dt, part).to_numpy(dtype=float, na_value=np.nan) for part in ('year', 'month', 'day')]
+        end_year, end_month, end_day = components(month_end)
+        dob_year, dob_month, dob_day = components(dob)
+
+        years = end_year - dob_year
+        months = end_month - dob_month
+        # Birthday not yet reached by the month end: one year less, twelve months more
+        before_birthday = (end_month < dob_month) | ((end_month == dob_month) & (end_day < dob_day))
+        years = np.where(before_birthday, years - 1, years)
+        months = np.where(before_birthday, months + 12, months)
+
+        self.investor_df['AGE AT TRANSACTION'] = years + (months / 12)
+            
+    def _add_scheme_and_nav_details(self):
+        """Join ISIN, OPTDESC, SCHEMEDESC and NAV onto the investor rows and compute their valuation."""
+        self.progress(0.7, "Adding ISIN, OPTDESC and NAV values...")
+        investors = self.investor_df
+
+        # Scheme details by SCHEME and descriptions by ISIN; the last listing of a key wins
+        scheme_details = self.rta_df[['SCHEME', 'ISIN', 'OPTDESC']].drop_duplicates('SCHEME', keep='last')
+        scheme_descs = self.rta_df[['ISIN', 'SCHEMEDESC']].drop_duplicates('ISIN', keep='last')
+        schemes = pd.DataFrame({'SCHEME': investors['SCHEME'].astype(object).to_numpy()}).merge(
+            scheme_details.astype({'SCHEME': object}), on='SCHEME', how='left', validate='many_to_one'
+        )
+        isin = schemes['ISIN'].fillna('Not Found')
+        descs = pd.DataFrame({'ISIN': isin.astype(object).to_numpy()}).merge(
+            scheme_descs.astype({'ISIN': object}), on='ISIN', how='left', validate='many_to_one'
+        )
+        investors['ISIN'] = isin.to_numpy()
+        investors['OPTDESC'] = schemes['OPTDESC'].fillna('Not Found').to_numpy()
+        investors['SCHEMEDESC'] = descs['SCHEMEDESC'].fillna('Not Found').to_numpy()
+
+        self.progress(0.8, "Adding NAV values...")
+        isin_found = (isin != 'Not Found').to_numpy()
+        reinvestment = map_distinct(investors['OPTDESC'], lambda optdesc: 'REINVESTMENT' in str(optdesc).upper(), na_value=False)
+        reinvestment = reinvestment.to_numpy(dtype=bool)
+
+        # Look the ISIN up in the growth and reinvestment ISIN columns of the AMFI data, then pick per row
+        def nav_lookup(isin_col):
+            navs = self.amfi_df[[isin_col, 'NET ASSET VALUE']].drop_duplicates(isin_col, keep='last')
+            matched = pd.DataFrame({isin_col: isin.astype(object).to_numpy()}).merge(
+                navs.astype({isin_col: object}), on=isin_col, how='left', validate='many_to_one', indicator=True
+            )
+            nav = pd.to_numeric(matched['NET ASSET VALUE'], errors='coerce').to_numpy(dtype=float)
+            return nav, (matched['_merge'] == 'both').to_numpy()
+        growth_nav, growth_found = nav_lookup('ISIN DIV PAYOUT/ISIN GROWTH')
+        reinvestment_nav, reinvestment_found = nav_lookup('ISIN DIV REINVESTMENT')
+        nav = np.where(reinvestment, reinvestment_nav, growth_nav)
+        nav_found = isin_found & np.where(reinvestment, reinvestment_found, growth_found)
+        nav[~nav_found] = np.nan
+
+        investors['NAV'] = nav
+        investors['NAV STATUS'] = np.select(
+            [~isin_found, ~nav_found, np.isnan(nav)],
+            ['ISIN Not Found', 'NAV Not Found', 'NAV Not Numeric'],
+            default='Found'
+        )
+
+        self.progress(0.85, "Calculating valuation...")
+        units = pd.to_numeric(investors['PURCHASEUNITS'], errors='coerce').to_numpy(dtype=float)
+        investors['VALUATION OF INVESTOR'] = units * nav
+            
+    def _perform_specific_checks(self):
+        """Perform the KYC verification checks in KYC_RULES."""
+        self.matched_schemes = {}
+        self.check_flags = np.zeros((len(self.investor_df), len(KYC_RULES)), dtype=bool)
+        # Taking from a two-label array keeps the column dtype without converting a string per row
+        labels = pd.Series(['OK', 'Check']).array
+        try:
+            for check_id, rule in enumerate(KYC_RULES):
+                flagged = self._rule_mask(rule)
+                self.check_flags[:, check_id] = flagged
+                self.investor_df[rule['column']] = labels.take(flagged.astype(np.intp))
+        finally:
+            # The text views belong to this investor_df; drop them so a later run starts clean
+            self._text_columns = {}
+
+    def _text_column(self, col):
+        """
+        Factorized upper-cased text of a column as (codes, uniques), built once per run. Missing
+        entries have code -1; an absent column is all missing.
+        """
+        if col not in self._text_columns:
+            if col in self.investor_df.columns:
+                codes, uniques = pd.factorize(self.investor_df[col])
+                uniques = np.array([str(value).upper() for value in uniques], dtype=object)
+            else:
+                codes, uniques = np.full(len(self.investor_df), -1, dtype=np.intp), np.empty(0, dtype=object)
+            self._text_columns[col] = (codes, uniques)
+        return self._text_columns[col]
+
+    def _numeric_column(self, col):
+        """Float array of a column; missing or non-numeric values become NaN."""
+        return pd.to_numeric(self.investor_df[col], errors='coerce').to_numpy(dtype=float)
+
+    def _rule_mask(self, rule):
+        """Compile one KYC_RULES entry to a boolean array over the investor rows."""
+        mask = np.ones(len(self.investor_df), dtype=bool)
+
+        arn_condition = rule.get('arn')
+        if arn_condition:
+            codes, uniques = self._text_column('ARNNAME')
+            if arn_condition == 'not_exactly_direct':
+                mask &= map_codes(codes, uniques, lambda arn: arn.strip() != 'DIRECT', na_value=True)
+            else:
+                direct = contains_any(codes, uniques, ['DIRECT'])
+                if arn_condition == 'not_direct':
+                    mask &= (codes >= 0) & ~direct
+                else:
+                    mask &= ~direct
+
+        scheme_any = rule.get('scheme_any')
+        if scheme_any is not None:
+            if isinstance(scheme_any, str):
+                scheme_any = getattr(self, scheme_any)
+            matcher = NameMatcher(scheme_any)
+            schemes = self._text_column('SCHEMEDESC')
+            self.matched_schemes[rule['column']] = matcher.matches(*schemes)
+            mask &= matcher.contains(*schemes)
+        if rule.get('scheme_none'):
+            mask &= ~contains_any(*self._text_column('SCHEMEDESC'), rule['scheme_none'])
+        if rule.get('stat_any'):
+            mask &= contains_any(*self._text_column('STATDESC'), rule['stat_any'])
+        if rule.get('occupation_any'):
+            mask &= contains_any(*self._text_column('OCCUPATION_DESCRIPTION'), rule['occupation_any'])
+
+        # NaN compares False, so rows without an age/valuation are never flagged
+        with np.errstate(invalid='ignore'):
+            if 'min_age' in rule:
+                mask &= self._numeric_column('AGE AT TRANSACTION') >= rule['min_age']
+            if 'min_valuation' in rule:
+                mask &= self._numeric_column('VALUATION OF INVESTOR') >= rule['min_valuation']
+            if 'income_multiple' in rule:
+                if 'INCOMESLAB' in self.investor_df.columns:
+                    income = map_distinct(self.investor_df['INCOMESLAB'], convert_income_slab_to_number)
+                    income = pd.to_numeric(income, errors='coerce').to_numpy(dtype=float)
+                else:
+                    income = np.full(len(self.investor_df), np.nan)
+                mask &= self._numeric_column('VALUATION OF INVESTOR') >= rule['income_multiple'] * income
+        return mask
+
+    def save(self, output_path):
+        """Save a 'Main Data' sheet with all information, and a 'Checks Info' sheet with grouped checks."""
+        if self.investor_df is None:
+            raise ValueError("No processed data to save; call run() first")
+        self.progress(0.95, "Saving file...")
+        try:
+            import xlsxwriter
+        except ImportError:
+            # Fallback to openpyxl if xlsxwriter is not available
+            print("xlsxwriter not available, using openpyxl write-only mode...")
+            self._save_openpyxl(output_path)
+        else:
+            self._save_xlsxwriter(output_path)
+
+    def flagged_rows(self):
+        """Investor rows marked 'Check' by at least one of the KYC rules."""
+        return self.investor_df[self.check_flags.any(axis=1)]
+
+    def export(self, output_base, formats=('parquet',)):
+        """
+        Write the processed investor data as '<output_base>.<format>' and its flagged rows as
+        '<output_base>_flagged.<format>', for machine consumers that don't need the formatted workbook.
+        Returns the written paths.
+        """
+        if self.investor_df is None:
+            raise ValueError("No processed data to export; call run() first")
+        return export_frames({'': self.investor_df, '_flagged': self.flagged_rows()}, output_base, formats)
+
+    def _checks_info_blocks(self):
+        """(title, columns, flagged rows, fill colour) for each check with at least one flagged row."""
+        # Find the columns from ACNO to VALUATION OF INVESTOR (inclusive)
+        all_columns = list(self.investor_df.columns)
+        try:
+            acno_idx = all_columns.index('ACNO')
+            val_idx = all_columns.index('VALUATION OF INVESTOR')
+            acno_to_val_cols = all_columns[acno_idx:val_idx+1]
+        except ValueError:
+            # Fallback: if not found, use all columns
+            acno_to_val_cols = all_columns
+
+        # The flagged (check, row) pairs of the rule masks, grouped by check
+        check_ids, row_positions = np.nonzero(self.check_flags.T)
+        bounds = np.searchsorted(check_ids, np.arange(len(KYC_RULES) + 1))
+
+        blocks = []
+        for check_id, rule in enumerate(KYC_RULES):
+            positions = row_positions[bounds[check_id]:bounds[check_id + 1]]
+            if len(positions) == 0:
+                continue
+            check_col = rule['column']
+            # Columns for this block: all from ACNO to VALUATION OF INVESTOR, plus the check column (if not already included)
+            block_columns = acno_to_val_cols.copy()
+            if check_col not in block_columns:
+                block_columns.append(check_col)
+            # Pick the flagged rows before the columns, so only those rows are ever copied
+            check_df = self.investor_df.iloc[positions][block_columns]
+            # Show which listed scheme name the SCHEMEDESC matched, just before the check column
+            matched = self.matched_schemes.get(check_col)
+            if matched is not None:
+                check_df.insert(block_columns.index(check_col), 'MATCHED SCHEME', matched[positions])
+                block_columns = list(check_df.columns)
+            blocks.append((check_col, block_columns, check_df, rule['color']))
+        return blocks
+
+    def _main_data_widths(self):
+        """Main Data column widths, measured on the first WIDTH_SAMPLE_ROWS rows plus the headers."""
+        return frame_column_widths(self.investor_df, [str(col) for col in self.investor_df.columns],
+                                   sample_rows=self.WIDTH_SAMPLE_ROWS)
+
+    def _checks_info_widths(self, blocks):
+        """Checks Info column widths: the widest fit of each column position over all blocks."""
+        widths = []
+        for _, block_columns, check_df, _ in blocks:
+            for col_idx, width in enumerate(frame_column_widths(check_df, block_columns)):
+                if col_idx < len(widths):
+                    widths[col_idx] = max(widths[col_idx], width)
+                else:
+                    widths.append(width)
+        return widths
+
+    def _save_xlsxwriter(self, output_path):
+        """Stream both sheets with xlsxwriter in constant_memory mode (rows are flushed as they are written)."""
+        import xlsxwriter
+
+        workbook = xlsxwriter.Workbook(output_path, {'constant_memory': True})
+        header_format = workbook.add_format({
+            'bold': True, 'font_color': '#FFFFFF', 'font_size': 11, 'bg_color': '#305496',
+            'align': 'center', 'valign': 'vcenter', 'text_wrap': True
+        })
+        title_format = workbook.add_format({'bold': True, 'font_size': 13, 'font_color': '#305496', 'align': 'center', 'valign': 'vcenter'})
+        date_format = workbook.add_format({'num_format': EXCEL_DATE_FORMAT})
+
+        def write_rows(worksheet, first_row, frame, last_col_format=None):
+            date_cols = {i for i, dtype in enumerate(frame.dtypes) if pd.api.types.is_datetime64_any_dtype(dtype)}
+            last_col = frame.shape[1] - 1
+            row_idx = first_row
+            for row in iter_excel_rows(frame):
+                for col_idx, value in enumerate(row):
+                    if value is None:
+                        continue
+                    # Typed writes skip xlsxwriter's per-value type sniffing (text is never turned into URLs/formulas)
+                    if col_idx in date_cols:
+                        worksheet.write_datetime(row_idx, col_idx, value, date_format)
+                    elif type(value) is str:
+                        if col_idx == last_col and last_col_format is not None and value == 'Check':
+                            worksheet.write_string(row_idx, col_idx, value, last_col_format)
+                        else:
+                            worksheet.write_string(row_idx, col_idx, value)
+                    elif type(value) is float or type(value) is int:
+                        worksheet.write_number(row_idx, col_idx, value)
+                    else:
+                        worksheet.write(row_idx, col_idx, value)
+                row_idx += 1
+            return row_idx
+
+        # Main Data sheet (all rows, all columns)
+        ws_main = workbook.add_worksheet('Main Data')
+        for col_idx, width in enumerate(self._main_data_widths()):
+            ws_main.set_column(col_idx, col_idx, width)
+        ws_main.write_row(0, 0, [str(col) for col in self.investor_df.columns], header_format)
+        write_rows(ws_main, 1, self.investor_df)
+
+        # Checks Info sheet (grouped by check, only issues)
+        ws_checks = workbook.add_worksheet('Checks Info')
+        blocks = self._checks_info_blocks()
+        for col_idx, width in enumerate(self._checks_info_widths(blocks)):
+            ws_checks.set_column(col_idx, col_idx, width)
+        check_formats = {color: workbook.add_format({'bold': True, 'bg_color': f'#{color}'}) for _, _, _, color in blocks}
+        conditional = self.highlight_mode == 'conditional'
+        row_cursor = 0
+        for title, block_columns, check_df, color in blocks:
+            check_format = check_formats[color]
+            if len(block_columns) > 1:
+                ws_checks.merge_range(row_cursor, 0, row_cursor, len(block_columns) - 1, title, title_format)
+            else:
+                ws_checks.write(row_cursor, 0, title, title_format)
+            ws_checks.write_row(row_cursor + 1, 0, block_columns, header_format)
+            first_row = row_cursor + 2
+            row_cursor = write_rows(ws_checks, first_row, check_df, None if conditional else check_format) + 1
+            if conditional:
+                last_col = len(block_columns) - 1
+                ws_checks.conditional_format(first_row, last_col, first_row + len(check_df) - 1, last_col, {
+                    'type': 'cell', 'criteria': '==', 'value': '"Check"', 'format': check_format
+                })
+
+        workbook.close()
+
+    def _save_openpyxl(self, output_path):
+        """Stream both sheets with an openpyxl write-only workbook, using shared named styles."""
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.formatting.rule import CellIsRule
+        from openpyxl.styles import NamedStyle, PatternFill, Font, Alignment
+        from openpyxl.utils import get_column_letter
+        from openpyxl.worksheet.cell_range import CellRange
+
+        wb = Workbook(write_only=True)
+        header_style = NamedStyle(
+            name='KYC Header',
+            fill=PatternFill(start_color='305496', end_color='305496', fill_type='solid'),
+            font=Font(color='FFFFFF', bold=True, size=11),
+            alignment=Alignment(horizontal='center', vertical='center', wrap_text=True)
+        )
+        title_style = NamedStyle(name='KYC Title', font=Font(bold=True, size=13, color='305496'),
+                                 alignment=Alignment(horizontal='center', vertical='center'))
+        date_style = NamedStyle(name='KYC Date', number_format=EXCEL_DATE_FORMAT)
+        for style in (header_style, title_style, date_style):
+            wb.add_named_style(style)
+
+        def styled(ws, value, style):
+            cell = WriteOnlyCell(ws, value=value)
+            cell.style = style
+            return cell
+
+        def append_rows(ws, frame, check_style=None):
+            date_cols = [i for i, dtype in enumerate(frame.dtypes) if pd.api.types.is_datetime64_any_dtype(dtype)]
+            last_col = frame.shape[1] - 1
+            for row in iter_excel_rows(frame):
+                for col_idx in date_cols:
+                    if row[col_idx] is not None:
+                        row[col_idx] = styled(ws, row[col_idx], date_style)
+                if check_style is not None and row[last_col] == 'Check':
+                    row[last_col] = styled(ws, row[last_col], check_style)
+                ws.append(row)
+
+        # Main Data sheet (all rows, all columns); widths must be set before any row is written
+        ws_main = wb.create_sheet('Main Data')
+        for col_idx, width in enumerate(self._main_data_widths(), 1):
+            ws_main.column_dimensions[get_column_letter(col_idx)].width = width
+        ws_main.append([styled(ws_main, str(col), header_style) for col in self.investor_df.columns])
+        append_rows(ws_main, self.investor_df)
+
+        # Checks Info sheet (grouped by check, only issues)
+        ws_checks = wb.create_sheet('Checks Info')
+        blocks = self._checks_info_blocks()
+        for col_idx, width in enumerate(self._checks_info_widths(blocks), 1):
+            ws_checks.column_dimensions[get_column_letter(col_idx)].width = width
+        conditional = self.highlight_mode == 'conditional'
+        if not conditional:
+            for color in dict.fromkeys(color for _, _, _, color in blocks):
+                wb.add_named_style(NamedStyle(name=f'KYC Check {color}', font=Font(bold=True),
+                                              fill=PatternFill(start_color=color, end_color=color, fill_type='solid')))
+        row_cursor = 1
+        for title, block_columns, check_df, color in blocks:
+            ws_checks.merged_cells.add(CellRange(min_row=row_cursor, min_col=1, max_row=row_cursor, max_col=len(block_columns)))
+            ws_checks.append([styled(ws_checks, title, title_style)])
+            ws_checks.append([styled(ws_checks, col, header_style) for col in block_columns])
+            append_rows(ws_checks, check_df, None if conditional else f'KYC Check {color}')
+            ws_checks.append([])
+            if conditional:
+                check_col = get_column_letter(len(block_columns))
+                ws_checks.conditional_formatting.add(
+                    f"{check_col}{row_cursor + 2}:{check_col}{row_cursor + 1 + len(check_df)}",
+                    CellIsRule(operator='equal', formula=['"Check"'], font=Font(bold=True),
+                               fill=PatternFill(start_color=color, end_color=color, fill_type='solid'))
+                )
+            row_cursor += len(check_df) + 3
+
+        wb.save(output_path)
+
+def iter_excel_rows(frame, chunk_size=10000):
+    """
+    Yield the rows of a DataFrame as lists of plain Python values for the streaming writers,
+    converting one chunk at a time so memory stays flat however long the frame is.
+    Missing values (NaN/NaT/None) become None; datetimes stay datetimes.
+    """
+    for start in range(0, len(frame), chunk_size):
+        chunk = frame.iloc[start:start + chunk_size].astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            yield list(row)
+
+def main(argv=None):
+    """Command-line entry point for unattended mis-selling runs over one or more investor extracts."""
+    parser = argparse.ArgumentParser(description="Run the KYC mis-selling checks without the GUI.")
+    parser.add_argument('investor', nargs='+', help="Investor Master KYC file(s), e.g. one extract per ARN/branch")
+    parser.add_argument('--rta', required=True, help="RTA Master file")
+    parser.add_argument('--amfi', required=True, help="AMFI NAV Data file")
+    parser.add_argument('-o', '--output-dir', default='.', help="Directory for the processed workbooks (default: current directory)")
+    parser.add_argument('--underperforming', default='', help="Underperforming scheme names (comma separated)")
+    parser.add_argument('--credit-risk', default='', help="Credit risk fund names (comma separated)")
+    parser.add_argument('--highlight-mode', choices=KYCEngine.HIGHLIGHT_MODES, default='cells',
+                        help="Fill 'Check' cells directly, or through conditional-format rules over plain data (default: cells)")
+    parser.add_argument('--export', nargs='+', default=[], choices=EXPORT_FORMATS, metavar='FORMAT',
+                        help="Also write the data and its flagged rows as parquet and/or csv next to each workbook")
+    parser.add_argument('--no-workbook', action='store_true', help="Skip the formatted workbooks (use with --export)")
+    args = parser.parse_args(argv)
+    if args.no_workbook and not args.export:
+        parser.error("--no-workbook needs at least one --export format")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    # The masters are the same for every investor file; read them once
+    try:
+        rta_df = read_columns(args.rta, RTA_COLS, dtype=RTA_DTYPES)
+        amfi_df = read_columns(args.amfi, REQUIRED_AMFI_COLS, dtype=AMFI_DTYPES)
+    except Exception as e:
+        print(f"Error reading the master files: {e}", file=sys.stderr)
+        return 1
+    failed = 0
+    for investor_file in args.investor:
+        stem = os.path.splitext(os.path.basename(investor_file))[0]
+        output_base = os.path.join(args.output_dir, f"{stem}_Processed_MISS_Selling_KYC")
+        output_path = f"{output_base}.xlsx"
+        engine = KYCEngine(
+            investor_file,
+            args.rta,
+            args.amfi,
+            underperforming_schemes=args.underperforming,
+            credit_risk_funds=args.credit_risk,
+            highlight_mode=args.highlight_mode,
+            progress=lambda value, status_text: print(f"[{value:4.0%}] {status_text}"),
+            rta_df=rta_df,
+            amfi_df=amfi_df
+        )
+        try:
+            processed = engine.run()
+            written = []
+            if not args.no_workbook:
+                engine.save(output_path)
+                written.append(output_path)
+            if args.export:
+                written.extend(engine.export(output_base, args.export))
+        except Exception as e:
+            failed += 1
+            print(f"Error processing {investor_file}: {e}", file=sys.stderr)
+            continue
+        print(f"Processed {len(processed):,} rows from {investor_file} to {', '.join(written)}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
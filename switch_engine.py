@@ -0,0 +1,1650 @@
+"""
+Switch Data Extraction Engine
+The GUI-free pipeline behind the Switch Data Extractor: reads the trade, impalment, funding,
+scheme master and brokerage structure files, matches trail rates and writes the formatted workbook.
+Run it directly for unattended batch jobs (python switch_engine.py --help).
+"""
+
+import argparse
+import os
+import re
+import sys
+import hashlib
+import json
+import shutil
+import tempfile
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+from frame_utils import EXPORT_FORMATS, column_width, export_frames, map_distinct, read_columns
+
+def clean_text(text):
+    if isinstance(text, str):
+        # Make lowercase and remove all non-alphanumeric characters (spaces, hyphens, etc.)
+        cleaned = re.sub(r'[^a-z0-9]', '', text.lower())
+        # Replace all 'o' with '0' to handle O/0 confusion
+        cleaned = cleaned.replace('o', '0')
+        return cleaned
+    return text
+
+# Trade file columns kept for extraction, matched case-insensitively
+TRADE_COLUMNS = ['SWITCH_DETAILS_FOLIO_NO', 'TRADES_BROK_DLR_CODE', 'TRADES_AMOUNT', 'LONG_NAME1', 'LONG_NAME']
+# Agent codes and scheme names are always read as text so codes join alike in every file; amounts
+# are left to inference (floats for clean columns) since the checks coerce them with to_numeric
+TRADE_DTYPES = {'TRADES_BROK_DLR_CODE': str, 'AGENT': str, 'LONG_NAME': str, 'LONG_NAME1': str}
+
+def select_trade_columns(df):
+    """Upper-cases the trade file headers, drops '000000-0' dealer rows and keeps the TRADE_COLUMNS present."""
+    df.columns = [col.upper() for col in df.columns]
+    # Remove rows where TRADES_BROK_DLR_CODE is '000000-0'
+    if 'TRADES_BROK_DLR_CODE' in df.columns:
+        df = df[df['TRADES_BROK_DLR_CODE'] != '000000-0']
+    return df[[col for col in TRADE_COLUMNS if col in df.columns]]
+
+class SwitchExtractionEngine:
+    """Runs the switch extraction pipeline and writes its output, without any GUI."""
+    # 'cells' formats each highlighted cell as it is written; 'conditional' writes plain data
+    # and expresses the highlights as conditional-format rules over whole column ranges
+    HIGHLIGHT_MODES = ('cells', 'conditional')
+    HIGHLIGHT_FLAG_COLUMN = 'HIGHLIGHT MATCH'  # Helper column marking highlighted rows in 'conditional' mode
+    CHECK_COLUMNS = ['previous < current switch in TRAIL_1ST_YEAR', 'switching rate check', 'Direct to Regular']
+
+    def __init__(self, input_file_path, distributor_files=None, impalment_prev_files=None, funding_files=None,
+                 scheme_master_path=None, brokerage_file_paths=None, highlight_in='', highlight_out='',
+                 highlight_mode='cells', brokerage_cache_dir=None, brokerage_workers=None, csv_chunk_size=None,
+                 progress=None, brokerage_cache=True):
+        if highlight_mode not in self.HIGHLIGHT_MODES:
+            raise ValueError(f"Unknown highlight mode '{highlight_mode}', expected one of {', '.join(self.HIGHLIGHT_MODES)}")
+        self.input_file_path = input_file_path
+        self.distributor_files = list(distributor_files or [])  # Current month impalment files
+        self.impalment_prev_files = list(impalment_prev_files or [])  # Previous month impalment files
+        self.funding_files = list(funding_files or [])
+        self.scheme_master_path = scheme_master_path
+        self.brokerage_file_paths = list(brokerage_file_paths or [])
+        self.highlight_in = highlight_in or ''
+        self.highlight_out = highlight_out or ''
+        self.highlight_mode = highlight_mode
+        self.brokerage_cache_dir = brokerage_cache_dir  # None uses BrokerageCache.DEFAULT_DIR
+        self.brokerage_cache = brokerage_cache  # False parses every brokerage workbook afresh and caches nothing
+        self.brokerage_workers = brokerage_workers  # Processes for parsing brokerage sheets; None uses all cores, 1 parses sequentially
+        self.csv_chunk_size = csv_chunk_size  # Rows per chunk when streaming a CSV trade file; None reads it whole
+        # Progress callback taking (fraction done, status text), e.g. LoadingWindow.update_progress
+        self.progress = progress or (lambda value, status_text: None)
+
+        self.extracted_df = None
+        self.rows_to_highlight = []
+        self.agent_duplicates = None  # Agents listed more than once in the impalment files
+
+    def run(self):
+        """Run the full pipeline and return the extracted DataFrame (also kept on extracted_df)."""
+        if self.csv_chunk_size and self.input_file_path.endswith('.csv'):
+            return self._run_chunked()
+
+        self.progress(0.05, "Reading input file...")
+        # Read only the trade columns of the input file
+        df = read_columns(self.input_file_path, TRADE_COLUMNS, dtype=TRADE_DTYPES)
+        self.progress(0.15, "Processing columns...")
+        extracted = select_trade_columns(df)
+
+        lookups = self._build_lookups(extracted.get('TRADES_BROK_DLR_CODE'))
+        self.progress(0.5, "Matching trail rates...")
+        extracted = self._enrich_trades(extracted, lookups)
+        print(f"DEBUG | Rate category resolution: {lookups['rate_index'].resolver.stats()}")
+        return self._finish(extracted)
+
+    def _run_chunked(self):
+        """
+        run() for CSV inputs, reading csv_chunk_size rows at a time. Only the trade columns are
+        parsed, and each chunk is filtered and enriched against lookups built once up front, so the
+        rows dropped by select_trade_columns are never held all at once. The enriched chunks are
+        still concatenated into extracted_df, so peak memory grows with the filtered output, not
+        with the chunk size. No trades are known when the lookups are built, so brokerage sheets
+        are parsed for every agent's rate categories rather than only the traded agents'.
+        """
+        self.progress(0.05, "Reading input header...")
+        header = pd.read_csv(self.input_file_path, nrows=0).columns
+        usecols = [col for col in header if col.upper() in TRADE_COLUMNS]
+        dtype = {col: TRADE_DTYPES[col.upper()] for col in usecols if col.upper() in TRADE_DTYPES}
+
+        # No trades are loaded yet, so brokerage sheets are picked for every agent's rate categories
+        lookups = self._build_lookups()
+        self.progress(0.5, "Matching trail rates...")
+        parts = []
+        rows_read = 0
+        with pd.read_csv(self.input_file_path, usecols=usecols, dtype=dtype, chunksize=self.csv_chunk_size) as reader:
+            for chunk in reader:
+                rows_read += len(chunk)
+                chunk = select_trade_columns(chunk)
+                if not chunk.empty:
+                    parts.append(self._enrich_trades(chunk, lookups))
+                self.progress(0.5, f"Matching trail rates... {rows_read:,} rows read")
+        if not parts:
+            # Nothing left after filtering; enrich an empty frame so the result keeps its usual columns
+            empty = select_trade_columns(pd.read_csv(self.input_file_path, usecols=usecols, dtype=dtype, nrows=0))
+            parts.append(self._enrich_trades(empty, lookups))
+        print(f"DEBUG | Read {rows_read:,} trade rows in chunks of {self.csv_chunk_size:,}")
+        print(f"DEBUG | Rate category resolution: {lookups['rate_index'].resolver.stats()}")
+        return self._finish(pd.concat(parts, ignore_index=True))
+
+    def _build_lookups(self, trade_agents=None):
+        """
+        Load everything trades are enriched against: the agent dimension from the impalment files,
+        the funding payouts, the Scheme Master and the brokerage rate index. Brokerage sheets are
+        parsed only for the rate categories of trade_agents (all agents when None).
+        """
+        lookups = {'agent_dim': None, 'funding_wide': None, 'scheme_lookup': {}, 'scheme_types': {}}
+
+        # Build one agent dimension from all current and previous impalment files, joined once per frame
+        if self.distributor_files or self.impalment_prev_files:
+            self.progress(0.25, "Merging impalment files...")
+            agent_dim, self.agent_duplicates = build_agent_dimension(
+                self._read_impalment_files(self.distributor_files),
+                self._read_impalment_files(self.impalment_prev_files)
+            )
+            if not self.agent_duplicates.empty:
+                conflicts = self.agent_duplicates[self.agent_duplicates['CONFLICTING']]
+                print(f"DEBUG | {len(self.agent_duplicates)} agents listed more than once in impalment files "
+                      f"({len(conflicts)} with conflicting RATECATEGORY); the first uploaded file wins")
+                for _, dup in conflicts.head(5).iterrows():
+                    print(f"  {dup['SOURCE']} | {dup['AGENT']}: {dup['RATECATEGORIES']}")
+            lookups['agent_dim'] = agent_dim
+
+        # --- Funding File Payout Merge Logic ---
+        month_abbr = {
+            'january': 'JAN', 'february': 'FEB', 'march': 'MAR', 'april': 'APR', 'may': 'MAY', 'june': 'JUN',
+            'july': 'JUL', 'august': 'AUG', 'september': 'SEP', 'october': 'OCT', 'november': 'NOV', 'december': 'DEC'
+        }
+        if self.funding_files:
+            # Stack every file into one long (AgentCode, payout column, Net_Amount) table
+            funding_parts = []
+            for funding_file in self.funding_files:
+                fname = os.path.basename(funding_file)
+                # Extract month from filename
+                m = re.search(r'FundingSummary_([A-Za-z]+)\d{4}', fname)
+                if m:
+                    month_str = m.group(1).lower()
+                    month_col = month_abbr.get(month_str, month_str.upper())
+                    colname = f'PAYOUT {month_col}'
+                else:
+                    colname = f'PAYOUT {fname}'
+                try:
+                    fund_df = read_funding_file(funding_file)
+                except Exception as e:
+                    print(f"Error reading funding file {fname}: {e}")
+                    continue
+                if fund_df is not None:
+                    funding_parts.append(fund_df.assign(PAYOUT_COLUMN=colname))
+                else:
+                    print(f"Could not find header row in funding file: {fname}")
+
+            if funding_parts:
+                # Sum per agent and month so repeated agents cannot multiply trade rows,
+                # then pivot to one PAYOUT <MON> column per month and join once
+                funding_long = pd.concat(funding_parts, ignore_index=True)
+                funding_long['Net_Amount'] = pd.to_numeric(funding_long['Net_Amount'], errors='coerce')
+                payout_cols = list(dict.fromkeys(funding_long['PAYOUT_COLUMN']))
+                funding_wide = (
+                    funding_long.groupby(['AgentCode', 'PAYOUT_COLUMN'])['Net_Amount']
+                    .sum(min_count=1)
+                    .unstack('PAYOUT_COLUMN')
+                    .reindex(columns=payout_cols)
+                )
+                funding_wide.columns.name = None
+                lookups['funding_wide'] = funding_wide.rename_axis('TRADES_BROK_DLR_CODE').reset_index()
+        # --- End Funding File Payout Merge Logic ---
+
+        # Prepare Scheme Master lookup
+        scheme_lookup = {}
+        if self.scheme_master_path:
+            self.progress(0.30, "Reading scheme master...")
+            print("\n--- Loading Scheme Master File ---")
+            try:
+                # Only the scheme and scheme type columns are parsed, matched on normalized names
+                scheme_df = read_columns(self.scheme_master_path, ['scheme', 'schemetype'],
+                                         dtype={'scheme': str}, normalize=normalize_colname)
+                print(f"DEBUG | Successfully loaded scheme master. Found {len(scheme_df)} rows.")
+                print(f"DEBUG | Normalized Columns: {list(scheme_df.columns)}")
+
+                if 'scheme' in scheme_df.columns and 'schemetype' in scheme_df.columns:
+                    print("DEBUG | 'scheme' and 'schemetype' columns found.")
+                    # Create a normalized version of the fund names for matching
+                    scheme_df['NORMALIZED_SCHEME'] = map_distinct(scheme_df['scheme'], core_fund_key, na_value='')
+                    # Create a lookup dictionary for fast matching
+                    scheme_lookup = pd.Series(
+                        scheme_df['schemetype'].values,
+                        index=scheme_df['NORMALIZED_SCHEME']
+                    ).to_dict()
+                    print(f"DEBUG | Created lookup dictionary with {len(scheme_lookup)} entries.")
+                    # Print first 5 items for verification
+                    print("DEBUG | Sample of lookup dictionary:")
+                    for i, (k, v) in enumerate(scheme_lookup.items()):
+                        if i >= 5: break
+                        print(f"  '{k}' -> '{v}'")
+                else:
+                    print("ERROR | 'scheme' or 'schemetype' column not found in Scheme Master!")
+
+            except Exception as e:
+                print(f"ERROR | Could not process Scheme Master file. Error: {e}")
+            print("--- Finished Loading Scheme Master ---\n")
+        lookups['scheme_lookup'] = scheme_lookup
+
+        self.progress(0.35, "Preparing for matching...")
+        # --- Start of new Brokerage Matching Logic ---
+        rate_tables = {}
+        resolver = RateCategoryResolver(rate_tables)
+        # Pre-load all sheets from all brokerage files, reusing cached parses of unchanged files
+        if self.brokerage_file_paths:
+            self.progress(0.40, "Loading brokerage files...")
+            # Only the sheets that the traded agents' rate categories resolve to are parsed
+            rate_categories = []
+            agent_dim = lookups['agent_dim']
+            if agent_dim is not None:
+                if trade_agents is not None:
+                    agent_dim = agent_dim[agent_dim['AGENT'].isin(trade_agents)]
+                rate_category_cols = [col for col in ['RATECATEGORY', 'RATECATEGORY -Previous'] if col in agent_dim.columns]
+                rate_categories = pd.unique(agent_dim[rate_category_cols].values.ravel())
+            rate_tables, resolver = load_brokerage_rate_tables(
+                self.brokerage_file_paths,
+                rate_categories=[rate_category for rate_category in rate_categories if pd.notna(rate_category)],
+                cache=BrokerageCache(self.brokerage_cache_dir) if self.brokerage_cache else None,
+                workers=self.brokerage_workers
+            )
+
+        # Build the (sheet, fund) -> trail hash table from the prepared sheets
+        # The resolver that picked the sheets also maps the trades, so each category is matched once
+        lookups['rate_index'] = BrokerageRateIndex(rate_tables, resolver)
+        lookups['rate_table'] = lookups['rate_index'].to_frame()
+        return lookups
+
+    def _enrich_trades(self, extracted, lookups):
+        """
+        Join agents, payouts, scheme types and trail rates onto trade rows and add the check
+        columns. Every output row depends only on its own trade row, so this runs on the whole
+        file or chunk by chunk; scheme types found by earlier chunks are reused from lookups.
+        """
+        if lookups['agent_dim'] is not None:
+            extracted = extracted.merge(
+                lookups['agent_dim'],
+                left_on='TRADES_BROK_DLR_CODE',
+                right_on='AGENT',
+                how='left',
+                validate='many_to_one'
+            ).drop(columns=['AGENT'])
+        if lookups['funding_wide'] is not None:
+            extracted = extracted.merge(
+                lookups['funding_wide'],
+                on='TRADES_BROK_DLR_CODE',
+                how='left',
+                validate='many_to_one'
+            )
+
+        col_order = ['TRADES_BROK_DLR_CODE', 'RATECATEGORY']
+        rest_cols = [col for col in extracted.columns if col not in col_order]
+        extracted = extracted[[col for col in col_order if col in extracted.columns] + rest_cols]
+        rate_index = lookups['rate_index']
+
+        # Scheme types resolved once per distinct fund name across both switch columns
+        core_in_name = map_distinct(extracted['LONG_NAME'], core_fund_key, na_value='')
+        core_out_name = map_distinct(extracted['LONG_NAME1'], core_fund_key, na_value='')
+        scheme_types = lookups['scheme_types']
+        new_names = [name for name in dict.fromkeys(pd.concat([core_in_name, core_out_name])) if name not in scheme_types]
+        if new_names:
+            scheme_types.update(self._get_scheme_types(new_names, lookups['scheme_lookup']))
+        switch_in_scheme_types = core_in_name.map(scheme_types).where(extracted['LONG_NAME'].notna(), '')
+        switch_out_scheme_types = core_out_name.map(scheme_types).where(extracted['LONG_NAME1'].notna(), '')
+
+        # Resolve rate categories to sheet keys once per distinct value, then join
+        # (sheet key, normalized fund) pairs against the rate table for every column at once
+        sheet_keys = rate_index.resolve_sheets(extracted.get('RATECATEGORY', pd.Series(None, index=extracted.index)))
+        sheet_keys_prev = rate_index.resolve_sheets(extracted.get('RATECATEGORY -Previous', pd.Series(None, index=extracted.index)))
+        fund_keys_in = core_in_name.where(extracted['LONG_NAME'].notna())
+        fund_keys_out = core_out_name.where(extracted['LONG_NAME1'].notna())
+        rate_table = lookups['rate_table']
+
+        switch_in_trails, switch_in_status = self._merge_trail_values(fund_keys_in, sheet_keys, rate_table)
+        switch_in_trails_prev, switch_in_status_prev = self._merge_trail_values(fund_keys_in, sheet_keys_prev, rate_table)
+        switch_out_trails, switch_out_status = self._merge_trail_values(fund_keys_out, sheet_keys, rate_table)
+
+        extracted['Scheme Type Swith IN'] = switch_in_scheme_types
+        extracted['Scheme Type Swith Out'] = switch_out_scheme_types
+        extracted['switch in TRAIL_1ST_YEAR'] = switch_in_trails
+        extracted['switch in MATCH_STATUS'] = switch_in_status
+        extracted['switch in TRAIL_1ST_YEAR -Previous'] = switch_in_trails_prev
+        extracted['switch in MATCH_STATUS -Previous'] = switch_in_status_prev
+        extracted['switch out TRAIL_1ST_YEAR'] = switch_out_trails
+        extracted['switch out MATCH_STATUS'] = switch_out_status
+
+        # Add the new column: previous < current switch in TRAIL_1ST_YEAR
+        prev_trails = pd.to_numeric(extracted['switch in TRAIL_1ST_YEAR -Previous'], errors='coerce')
+        curr_trails = pd.to_numeric(extracted['switch in TRAIL_1ST_YEAR'], errors='coerce')
+        extracted['previous < current switch in TRAIL_1ST_YEAR'] = ''
+        extracted.loc[(curr_trails > prev_trails).fillna(False), 'previous < current switch in TRAIL_1ST_YEAR'] = 'check'
+
+        # Add the switching rate check column
+        in_trails = pd.to_numeric(extracted['switch in TRAIL_1ST_YEAR'], errors='coerce')
+        out_trails = pd.to_numeric(extracted['switch out TRAIL_1ST_YEAR'], errors='coerce')
+
+        extracted['switching rate check'] = ''
+        extracted.loc[(in_trails > out_trails).fillna(False), 'switching rate check'] = 'check'
+
+        # --- New 'Direct to Regular' Logic ---
+
+        # Condition 1: Check if both scheme types are 'Equity Funds'
+        is_equity_in = extracted['Scheme Type Swith IN'].str.strip().str.lower() == 'equity funds'
+        is_equity_out = extracted['Scheme Type Swith Out'].str.strip().str.lower() == 'equity funds'
+
+        # Condition 2: Check for a switch from a 'Direct' plan to a 'Regular' plan
+        is_regular_in = map_distinct(extracted['LONG_NAME'], lambda name: 'regular' in str(name).lower(), na_value=False)
+        is_direct_out = map_distinct(extracted['LONG_NAME1'], lambda name: 'direct' in str(name).lower(), na_value=False)
+
+        # Condition 3: Check if the core fund name is the same for both
+        is_same_core_name = core_in_name == core_out_name
+
+        # Combine all conditions
+        final_condition = (
+            is_equity_in &
+            is_equity_out &
+            is_regular_in &
+            is_direct_out &
+            is_same_core_name
+        )
+
+        extracted['Direct to Regular'] = ''
+        extracted.loc[final_condition.fillna(False), 'Direct to Regular'] = 'check'
+
+        # --- End of new 'Direct to Regular' Logic ---
+
+        # --- End of new Brokerage Matching Logic ---
+
+        # Rename columns for output
+        rename_map = {
+            'LONG_NAME': 'switch in',
+            'LONG_NAME1': 'switch out'
+        }
+        extracted = extracted.rename(columns=rename_map)
+
+        # Define final column order and remove unwanted columns
+        final_col_order = [
+            'SWITCH_DETAILS_FOLIO_NO', 'TRADES_BROK_DLR_CODE', 'RATECATEGORY', 'RATECATEGORY -Previous', 'Effective Date', 'TRADES_AMOUNT',
+            'Scheme Type Swith IN', 'switch in', 'switch out', 'Scheme Type Swith Out',
+            'switch in TRAIL_1ST_YEAR', 'switch in TRAIL_1ST_YEAR -Previous',
+            'previous < current switch in TRAIL_1ST_YEAR',
+            'switch out TRAIL_1ST_YEAR',
+            'switching rate check', 'Direct to Regular'
+        ]
+        # Add all PAYOUT columns (for each month) to the output, after the standard columns
+        payout_cols = [col for col in extracted.columns if col.startswith('PAYOUT') and col not in final_col_order]
+        final_col_order += payout_cols
+
+        # Filter to only include columns that actually exist in the dataframe
+        final_cols_to_keep = [col for col in final_col_order if col in extracted.columns]
+        return extracted[final_cols_to_keep]
+
+    def _finish(self, extracted):
+        """Find the rows to highlight and keep the result on extracted_df."""
+        self.progress(0.95, "Saving extracted data...")
+        # --- Highlighting Logic (without adding a column) ---
+        highlight_in_text = self.highlight_in.strip().lower()
+        highlight_out_text = self.highlight_out.strip().lower()
+        self.rows_to_highlight = []  # Reset before each extraction
+
+        if highlight_in_text and highlight_out_text:
+            print("\n--- Highlighting Logic ---")
+            print(f"DEBUG | Highlight 'Switch In' contains: '{highlight_in_text}'")
+            print(f"DEBUG | Highlight 'Switch Out' contains: '{highlight_out_text}'")
+
+            if 'switch in' in extracted.columns and 'switch out' in extracted.columns:
+                match_in = extracted['switch in'].str.lower().str.contains(highlight_in_text, na=False)
+                match_out = extracted['switch out'].str.lower().str.contains(highlight_out_text, na=False)
+
+                print(f"DEBUG | Found {match_in.sum()} potential 'in' matches.")
+                print(f"DEBUG | Found {match_out.sum()} potential 'out' matches.")
+
+                # Store the indices of rows to be highlighted
+                self.rows_to_highlight = extracted[match_in & match_out].index.tolist()
+                print(f"DEBUG | Final rows to highlight (by index): {self.rows_to_highlight}")
+            else:
+                print("ERROR | 'switch in' or 'switch out' columns not found for highlighting.")
+            print("--- End Highlighting Logic ---\n")
+
+        self.extracted_df = extracted
+        return extracted
+
+    def _read_impalment_files(self, file_paths):
+        """Read AGENT / RATECATEGORY from impalment files, in upload order, skipping files without them."""
+        frames = []
+        for file_path in file_paths:
+            imp_df = read_columns(file_path, ['AGENT', 'RATECATEGORY'], dtype=TRADE_DTYPES)
+            if 'AGENT' in imp_df.columns and 'RATECATEGORY' in imp_df.columns:
+                frames.append(imp_df[['AGENT', 'RATECATEGORY']])
+        return frames
+
+    def _get_scheme_types(self, normalized_funds, scheme_lookup):
+        """
+        Resolve scheme types for distinct normalized fund names in one batch.
+        Direct lookups are tried first; the remaining names are fuzzy matched against every
+        Scheme Master key in a single rapidfuzz cdist call spread over all cores.
+        Returns a dict of normalized fund name -> scheme type ('' when unmatched).
+        """
+        names = list(dict.fromkeys(normalized_funds))
+        if not scheme_lookup:
+            return dict.fromkeys(names, '')
+
+        scheme_types = {}
+        unmatched = []
+        for name in names:
+            # 1. Try direct lookup with normalization for speed
+            scheme_type = scheme_lookup.get(name)
+            if scheme_type:
+                scheme_types[name] = scheme_type
+            else:
+                unmatched.append(name)
+
+        # 2. Fuzzy match everything the direct lookup missed in one scoring matrix
+        fuzzy_found = 0
+        if unmatched:
+            scheme_keys = list(scheme_lookup.keys())
+            scores = process.cdist(
+                unmatched,
+                scheme_keys,
+                scorer=fuzz.token_set_ratio,
+                score_cutoff=85,  # Lowered threshold to be less strict
+                dtype=np.float64,
+                workers=-1
+            )
+            best_cols = scores.argmax(axis=1)
+            best_scores = scores[np.arange(len(unmatched)), best_cols]
+            for name, best_col, best_score in zip(unmatched, best_cols, best_scores):
+                if best_score >= 85:
+                    scheme_types[name] = scheme_lookup[scheme_keys[best_col]]
+                    fuzzy_found += 1
+                else:
+                    scheme_types[name] = ''
+
+        print(f"DEBUG | Scheme types for {len(names)} distinct funds: "
+              f"{len(names) - len(unmatched)} direct, {fuzzy_found} fuzzy, {len(unmatched) - fuzzy_found} not found")
+        return scheme_types
+
+    def _merge_trail_values(self, fund_keys, sheet_keys, rate_table):
+        """
+        Left-join normalized fund names and resolved sheet keys against the rate table.
+        Returns (trail values, match status) arrays aligned with the input rows.
+        """
+        # Object keys so an all-missing column still joins against the text keys
+        keys = pd.DataFrame({'SHEET_KEY': sheet_keys.values, 'NORMALIZED_FUND': fund_keys.values}, dtype=object)
+        matched = keys.merge(
+            rate_table,
+            on=['SHEET_KEY', 'NORMALIZED_FUND'],
+            how='left',
+            indicator=True,
+            validate='many_to_one'
+        )
+        found = (matched['_merge'] == 'both').values
+        return matched['TRAIL_1ST_YEAR'].values, np.where(found, 'Found', 'Not Found')
+
+    def _highlight_flag_col(self, columns):
+        """Column index of the HIGHLIGHT MATCH helper column, or None when the sheet has none."""
+        if self.highlight_mode == 'conditional' and self.highlight_in.strip() and self.highlight_out.strip():
+            return len(columns)
+        return None
+
+    def save(self, file_path):
+        """Write the extracted data and analytics sheets to a formatted Excel workbook."""
+        if self.extracted_df is None:
+            raise ValueError("No data to save, run() the extraction first")
+        self.create_formatted_excel(file_path)
+
+    def flagged_rows(self):
+        """Rows marked 'check' by any of the trail/switching/direct checks or matching the switch in/out highlight."""
+        check_cols = [col for col in self.CHECK_COLUMNS if col in self.extracted_df.columns]
+        flagged = self.extracted_df.index.isin(self.rows_to_highlight)
+        for col in check_cols:
+            flagged |= (self.extracted_df[col] == 'check').to_numpy(dtype=bool)
+        return self.extracted_df[flagged]
+
+    def export(self, output_base, formats=('parquet',)):
+        """
+        Write the extracted data as '<output_base>.<format>' and its flagged rows as
+        '<output_base>_flagged.<format>', for machine consumers that don't need the formatted workbook.
+        Returns the written paths.
+        """
+        if self.extracted_df is None:
+            raise ValueError("No data to export, run() the extraction first")
+        return export_frames({'': self.extracted_df, '_flagged': self.flagged_rows()}, output_base, formats)
+
+    def create_formatted_excel(self, file_path):
+        """Create a professionally formatted Excel file"""
+        try:
+            # Try to import xlsxwriter
+            import xlsxwriter
+            self._create_formatted_excel_xlsxwriter(file_path)
+        except ImportError:
+            # Fallback to openpyxl if xlsxwriter is not available
+            print("xlsxwriter not available, using openpyxl for formatting...")
+            self._create_formatted_excel_openpyxl(file_path)
+        except Exception as e:
+            # Final fallback to simple Excel save
+            print(f"Advanced formatting failed, using simple save: {e}")
+            self.extracted_df.to_excel(file_path, index=False)
+
+    def _create_formatted_excel_xlsxwriter(self, file_path):
+        """Create formatted Excel using xlsxwriter, writing data manually."""
+        try:
+            import xlsxwriter
+            from xlsxwriter.utility import xl_col_to_name
+        except ImportError:
+            raise ImportError("xlsxwriter not available")
+        
+        with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
+            workbook = writer.book
+            worksheet = workbook.add_worksheet('Extracted Data')
+
+            # --- Define Formats ---
+            header_format = workbook.add_format({'bold': True, 'text_wrap': True, 'valign': 'top', 'fg_color': '#2c3e50', 'font_color': 'white', 'border': 1, 'align': 'center', 'font_size': 12})
+            data_format = workbook.add_format({'text_wrap': True, 'valign': 'top', 'border': 1, 'align': 'left', 'font_size': 10})
+            number_format = workbook.add_format({'text_wrap': True, 'valign': 'top', 'border': 1, 'align': 'right', 'font_size': 10, 'num_format': '#,##0.00'})
+            
+            # Add new highlight formats with dark blue background and white text
+            highlight_data_format = workbook.add_format({'bg_color': '#4F81BD', 'font_color': '#FFFFFF', 'text_wrap': True, 'valign': 'top', 'border': 1, 'align': 'left', 'font_size': 10})
+            highlight_number_format = workbook.add_format({'bg_color': '#4F81BD', 'font_color': '#FFFFFF', 'text_wrap': True, 'valign': 'top', 'border': 1, 'align': 'right', 'font_size': 10, 'num_format': '#,##0.00'})
+
+            # --- Write Header ---
+            # Move 'SWITCH_DETAILS_FOLIO_NO' to first column if present and rename to FOLIO_NO
+            columns = list(self.extracted_df.columns)
+            if 'SWITCH_DETAILS_FOLIO_NO' in columns:
+                columns.insert(0, columns.pop(columns.index('SWITCH_DETAILS_FOLIO_NO')))
+            source_columns = columns
+            columns = ['FOLIO_NO' if col == 'SWITCH_DETAILS_FOLIO_NO' else col for col in columns]
+            for col_num, value in enumerate(columns):
+                worksheet.write(0, col_num, value, header_format)
+            
+            # --- Write Data Column by Column ---
+            numeric_cols = ['TRADES_AMOUNT', 'switch in TRAIL_1ST_YEAR', 'switch out TRAIL_1ST_YEAR', 'switch in TRAIL_1ST_YEAR -Previous']
+            # Add a yellow highlight format for cell-level highlighting
+            highlight_cell_format = workbook.add_format({'bg_color': '#FFD700', 'font_color': '#000000', 'border': 1, 'align': 'left', 'font_size': 10})
+
+            # Per-row format selectors, computed once: highlighted rows and changed rate categories
+            is_highlighted = self.extracted_df.index.isin(self.rows_to_highlight)
+            ratecat_changed = rate_category_changes(self.extracted_df)
+            flag_col = self._highlight_flag_col(columns)
+            if self.highlight_mode == 'conditional':
+                # Plain data; the highlights are added as conditional formats after the data
+                highlight_flags = is_highlighted
+                is_highlighted = ratecat_changed = np.zeros(len(self.extracted_df), dtype=bool)
+            data_formats = np.where(is_highlighted, highlight_data_format, data_format)
+            number_formats = np.where(is_highlighted, highlight_number_format, number_format)
+
+            for col_idx, col_name in enumerate(source_columns):
+                cell_kinds, cell_values = excel_cell_values(self.extracted_df[col_name], numeric=col_name in numeric_cols)
+                if col_name in ['RATECATEGORY', 'RATECATEGORY -Previous']:
+                    # Highlight RATECATEGORY and RATECATEGORY -Previous if they differ
+                    cell_formats = np.where(ratecat_changed, highlight_cell_format, data_formats)
+                    number_cell_formats = np.where(ratecat_changed, highlight_cell_format, number_formats)
+                else:
+                    cell_formats, number_cell_formats = data_formats, number_formats
+                for excel_row_num, kind, value, cell_format, number_cell_format in zip(
+                        range(1, len(cell_kinds) + 1), cell_kinds, cell_values, cell_formats, number_cell_formats):
+                    if kind == CELL_NUMBER:
+                        worksheet.write_number(excel_row_num, col_idx, value, number_cell_format)
+                    elif kind == CELL_TEXT:
+                        worksheet.write_string(excel_row_num, col_idx, value, cell_format)
+                    else:
+                        worksheet.write_blank(excel_row_num, col_idx, None, cell_format)
+
+            if self.highlight_mode == 'conditional':
+                if flag_col is not None:
+                    worksheet.write(0, flag_col, self.HIGHLIGHT_FLAG_COLUMN, header_format)
+                    for excel_row_num, flagged in enumerate(highlight_flags, 1):
+                        if flagged:
+                            worksheet.write_string(excel_row_num, flag_col, 'Y', data_format)
+                        else:
+                            worksheet.write_blank(excel_row_num, flag_col, None, data_format)
+                    worksheet.set_column(flag_col, flag_col, len(self.HIGHLIGHT_FLAG_COLUMN) + 2)
+                rule_formats = {
+                    'ratecategory': workbook.add_format({'bg_color': '#FFD700', 'font_color': '#000000'}),
+                    'row': workbook.add_format({'bg_color': '#4F81BD', 'font_color': '#FFFFFF'}),
+                }
+                for kind, first_col, last_col, formula in conditional_highlight_rules(columns, flag_col, xl_col_to_name):
+                    worksheet.conditional_format(1, first_col, max(len(self.extracted_df), 1), last_col, {
+                        'type': 'formula', 'criteria': f"={formula}", 'format': rule_formats[kind]
+                    })
+
+            # --- Set Column Widths ---
+            for col_num, (source_column, col_name) in enumerate(zip(source_columns, columns)):
+                worksheet.set_column(col_num, col_num, column_width(self.extracted_df[source_column], col_name))
+
+            # --- Add Analytics Sheet ---
+            payout_cols = [col for col in self.extracted_df.columns if col.startswith('PAYOUT')]
+            # Add scheme type columns
+            scheme_type_cols = []
+            if 'Scheme Type Swith IN' in self.extracted_df.columns:
+                scheme_type_cols.append('Scheme Type Swith IN')
+            if 'Scheme Type Swith Out' in self.extracted_df.columns:
+                scheme_type_cols.append('Scheme Type Swith Out')
+            if 'SWITCH_DETAILS_FOLIO_NO' in self.extracted_df.columns:
+                analytics_df = self.extracted_df[self.extracted_df['previous < current switch in TRAIL_1ST_YEAR'] == 'check']
+                agg_dict = {
+                    'TRADES_AMOUNT': 'sum',
+                    'switch in TRAIL_1ST_YEAR': 'first',
+                    'switch in TRAIL_1ST_YEAR -Previous': 'first',
+                }
+                for col in payout_cols:
+                    agg_dict[col] = 'sum'
+                for col in scheme_type_cols:
+                    agg_dict[col] = 'first'
+                analytics_summary = analytics_df.groupby(
+                    ['SWITCH_DETAILS_FOLIO_NO', 'TRADES_BROK_DLR_CODE', 'switch in'], as_index=False
+                ).agg(agg_dict)
+                analytics_summary = analytics_summary.rename(columns={
+                    'SWITCH_DETAILS_FOLIO_NO': 'FOLIO_NO',
+                    'TRADES_BROK_DLR_CODE': 'ARN',
+                    'switch in': 'Switch In Scheme Name',
+                    'TRADES_AMOUNT': 'TRADES_AMOUNT(sum)',
+                    'switch in TRAIL_1ST_YEAR': 'switch in TRAIL_1ST_YEAR (CURRENT)',
+                    'switch in TRAIL_1ST_YEAR -Previous': 'switch in TRAIL_1ST_YEAR -Previous'
+                })
+                analytics_columns = list(analytics_summary.columns)
+            else:
+                analytics_df = self.extracted_df[self.extracted_df['previous < current switch in TRAIL_1ST_YEAR'] == 'check']
+                agg_dict = {
+                    'TRADES_AMOUNT': 'sum',
+                    'switch in TRAIL_1ST_YEAR': 'first',
+                    'switch in TRAIL_1ST_YEAR -Previous': 'first',
+                }
+                for col in payout_cols:
+                    agg_dict[col] = 'sum'
+                for col in scheme_type_cols:
+                    agg_dict[col] = 'first'
+                analytics_summary = analytics_df.groupby(
+                    ['TRADES_BROK_DLR_CODE', 'switch in'], as_index=False
+                ).agg(agg_dict)
+                analytics_summary = analytics_summary.rename(columns={
+                    'TRADES_BROK_DLR_CODE': 'ARN',
+                    'switch in': 'Switch In Scheme Name',
+                    'TRADES_AMOUNT': 'TRADES_AMOUNT(sum)',
+                    'switch in TRAIL_1ST_YEAR': 'switch in TRAIL_1ST_YEAR (CURRENT)',
+                    'switch in TRAIL_1ST_YEAR -Previous': 'switch in TRAIL_1ST_YEAR -Previous'
+                })
+                analytics_columns = list(analytics_summary.columns)
+            analytics_summary.to_excel(writer, sheet_name='Analytics', index=False, header=False, startrow=2)
+            worksheet_analytics = writer.sheets['Analytics']
+            num_cols = len(analytics_columns)
+            # Title format
+            analytics_title_format = workbook.add_format({'bold': True, 'font_size': 20, 'align': 'center', 'valign': 'vcenter', 'fg_color': '#4472C4', 'font_color': 'white'})
+            # Sub-header format
+            analytics_subheader_format = workbook.add_format({'bold': True, 'font_size': 12, 'align': 'center', 'valign': 'vcenter', 'fg_color': '#D9E1F2', 'font_color': '#4472C4'})
+            # Header format
+            analytics_header_format = workbook.add_format({'bold': True, 'font_size': 11, 'align': 'center', 'valign': 'vcenter', 'fg_color': '#2F3E5C', 'font_color': 'white', 'border': 1})
+            # Data format
+            analytics_data_format = workbook.add_format({'font_size': 10, 'border': 1})
+            # Title row (row 0)
+            worksheet_analytics.merge_range(0, 0, 0, num_cols-1, 'Distributor wise Analytics', analytics_title_format)
+            # Sub-header row (row 1)
+            worksheet_analytics.merge_range(1, 0, 1, num_cols-1, 'previous < current switch in TRAIL_1ST_YEAR', analytics_subheader_format)
+            # Column headers (row 2)
+            for col_num, value in enumerate(analytics_columns):
+                worksheet_analytics.write(2, col_num, value, analytics_header_format)
+            # Data rows (start at row 3)
+            for row_idx, row in analytics_summary.iterrows():
+                for col_idx, col_name in enumerate(analytics_columns):
+                    worksheet_analytics.write(row_idx + 3, col_idx, row[col_name], analytics_data_format)
+            # Set column widths
+            for col_num, col_name in enumerate(analytics_columns):
+                worksheet_analytics.set_column(col_num, col_num, column_width(analytics_summary[col_name], col_name))
+
+            # --- Add Switching Rate Analytics Sheet ---
+            switching_df = self.extracted_df[self.extracted_df['switching rate check'] == 'check']
+            if 'SWITCH_DETAILS_FOLIO_NO' in self.extracted_df.columns:
+                agg_dict = {
+                    'TRADES_AMOUNT': 'sum',
+                    'switch in TRAIL_1ST_YEAR': 'first',
+                    'switch out TRAIL_1ST_YEAR': 'first',
+                    'switching rate check': 'first',
+                }
+                for col in payout_cols:
+                    agg_dict[col] = 'sum'
+                for col in scheme_type_cols:
+                    agg_dict[col] = 'first'
+                switching_summary = switching_df.groupby(
+                    ['SWITCH_DETAILS_FOLIO_NO', 'TRADES_BROK_DLR_CODE', 'switch in', 'switch out'], as_index=False
+                ).agg(agg_dict)
+                switching_summary = switching_summary.rename(columns={
+                    'SWITCH_DETAILS_FOLIO_NO': 'FOLIO_NO',
+                    'TRADES_BROK_DLR_CODE': 'ARN',
+                    'switch in': 'Switch In Scheme Name',
+                    'switch out': 'Switch OUT Scheme Name',
+                    'TRADES_AMOUNT': 'TRADES_AMOUNT(sum)',
+                    'switch in TRAIL_1ST_YEAR': 'switch in TRAIL_1ST_YEAR',
+                    'switch out TRAIL_1ST_YEAR': 'switch OUT TRAIL_1ST_YEAR',
+                    'switching rate check': 'switching rate check'
+                })
+                switching_columns = list(switching_summary.columns)
+                switching_summary.to_excel(writer, sheet_name='Switching Rate Analytics', index=False, header=False, startrow=2)
+                worksheet_switching = writer.sheets['Switching Rate Analytics']
+                num_cols = len(switching_columns)
+                worksheet_switching.merge_range(0, 0, 0, num_cols-1, 'Switching Rate Analytics', analytics_title_format)
+                worksheet_switching.merge_range(1, 0, 1, num_cols-1, 'switch in TRAIL_1ST_YEAR > switch out TRAIL_1ST_YEAR', analytics_subheader_format)
+                for col_num, value in enumerate(switching_columns):
+                    worksheet_switching.write(2, col_num, value, analytics_header_format)
+                for row_idx, row in switching_summary.iterrows():
+                    for col_idx, col_name in enumerate(switching_columns):
+                        worksheet_switching.write(row_idx + 3, col_idx, row[col_name], analytics_data_format)
+                for col_num, col_name in enumerate(switching_columns):
+                    worksheet_switching.set_column(col_num, col_num, column_width(switching_summary[col_name], col_name))
+
+            # --- Add Direct to Regular Analytics Sheet ---
+            direct_df = self.extracted_df[self.extracted_df['Direct to Regular'] == 'check']
+            if 'SWITCH_DETAILS_FOLIO_NO' in self.extracted_df.columns:
+                agg_dict = {
+                    'TRADES_AMOUNT': 'sum',
+                }
+                for col in payout_cols:
+                    agg_dict[col] = 'sum'
+                for col in scheme_type_cols:
+                    agg_dict[col] = 'first'
+                direct_summary = direct_df.groupby(
+                    ['SWITCH_DETAILS_FOLIO_NO', 'TRADES_BROK_DLR_CODE', 'switch in', 'switch out'], as_index=False
+                ).agg(agg_dict)
+                direct_summary = direct_summary.rename(columns={
+                    'SWITCH_DETAILS_FOLIO_NO': 'FOLIO_NO',
+                    'TRADES_BROK_DLR_CODE': 'ARN',
+                    'switch in': 'Switch In Scheme Name',
+                    'switch out': 'Switch OUT Scheme Name',
+                    'TRADES_AMOUNT': 'TRADES_AMOUNT(sum)'
+                })
+                direct_columns = list(direct_summary.columns)
+                direct_summary.to_excel(writer, sheet_name='Direct to Regular Analytics', index=False, header=False, startrow=2)
+                worksheet_direct = writer.sheets['Direct to Regular Analytics']
+                num_cols = len(direct_columns)
+                worksheet_direct.merge_range(0, 0, 0, num_cols-1, 'Distributor wise Analytics', analytics_title_format)
+                worksheet_direct.merge_range(1, 0, 1, num_cols-1, 'Direct to Regular', analytics_subheader_format)
+                for col_num, value in enumerate(direct_columns):
+                    worksheet_direct.write(2, col_num, value, analytics_header_format)
+                for row_idx, row in direct_summary.iterrows():
+                    for col_idx, col_name in enumerate(direct_columns):
+                        worksheet_direct.write(row_idx + 3, col_idx, row[col_name], analytics_data_format)
+                for col_num, col_name in enumerate(direct_columns):
+                    worksheet_direct.set_column(col_num, col_num, column_width(direct_summary[col_name], col_name))
+
+    def _create_formatted_excel_openpyxl(self, file_path):
+        """Create formatted Excel using openpyxl as fallback, writing manually."""
+        from openpyxl import Workbook
+        from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
+        from openpyxl.formatting.rule import FormulaRule
+        from openpyxl.utils import get_column_letter
+
+        wb = Workbook()
+        ws = wb.active
+        ws.title = 'Extracted Data'
+
+        # --- Define Styles ---
+        header_font = Font(bold=True, color="FFFFFF", size=12)
+        header_fill = PatternFill(start_color="2C3E50", end_color="2C3E50", fill_type="solid")
+        header_alignment = Alignment(horizontal="center", vertical="top", wrap_text=True)
+        thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+        # Add new highlight styles
+        highlight_fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
+        highlight_font = Font(size=10, color="FFFFFF")
+        
+        # --- Write Header ---
+        # Move 'SWITCH_DETAILS_FOLIO_NO' to first column if present and rename to FOLIO_NO
+        columns = list(self.extracted_df.columns)
+        if 'SWITCH_DETAILS_FOLIO_NO' in columns:
+            columns.insert(0, columns.pop(columns.index('SWITCH_DETAILS_FOLIO_NO')))
+        columns = ['FOLIO_NO' if col == 'SWITCH_DETAILS_FOLIO_NO' else col for col in columns]
+        for col_idx, col_name in enumerate(columns, 1):
+            cell = ws.cell(row=1, column=col_idx, value=col_name)
+            cell.font = header_font
+            cell.fill = header_fill
+            cell.alignment = header_alignment
+            cell.border = thin_border
+
+        # --- Write Data ---
+        data_font = Font(size=10)
+        data_alignment = Alignment(horizontal="left", vertical="top", wrap_text=True)
+        numeric_cols = ['TRADES_AMOUNT', 'switch in TRAIL_1ST_YEAR', 'switch out TRAIL_1ST_YEAR', 'switch in TRAIL_1ST_YEAR -Previous']
+        # Add a yellow highlight fill for cell-level highlighting
+        highlight_cell_fill = PatternFill(start_color="FFD700", end_color="FFD700", fill_type="solid")
+        # In 'conditional' mode cells are written plain and highlighted by the rules added below
+        cell_highlights = self.highlight_mode == 'cells'
+        highlighted_rows = set(self.rows_to_highlight)
+        flag_col = self._highlight_flag_col(columns)
+        if flag_col is not None:
+            cell = ws.cell(row=1, column=flag_col + 1, value=self.HIGHLIGHT_FLAG_COLUMN)
+            cell.font = header_font
+            cell.fill = header_fill
+            cell.alignment = header_alignment
+            cell.border = thin_border
+        for row_pos, (row_idx, row) in enumerate(self.extracted_df.iterrows()):
+            excel_row_num = row_pos + 2  # +2 for 1-based position and header, matching the conditional ranges
+            is_highlighted = cell_highlights and row_idx in highlighted_rows
+            if flag_col is not None:
+                cell = ws.cell(row=excel_row_num, column=flag_col + 1, value='Y' if row_idx in highlighted_rows else '')
+                cell.font = data_font
+                cell.alignment = data_alignment
+                cell.border = thin_border
+            row_values = list(row)
+            if 'SWITCH_DETAILS_FOLIO_NO' in self.extracted_df.columns:
+                idx = self.extracted_df.columns.get_loc('SWITCH_DETAILS_FOLIO_NO')
+                row_values.insert(0, row_values.pop(idx))
+            for col_idx, value in enumerate(row_values, 1):
+                col_name = columns[col_idx - 1]
+                if pd.isna(value):
+                    value = '' # Replace NaN with blank string
+                cell = ws.cell(row=excel_row_num, column=col_idx, value=value)
+                cell.alignment = data_alignment
+                cell.border = thin_border
+                fill = None
+                # Highlight RATECATEGORY and RATECATEGORY -Previous if they differ
+                if cell_highlights and col_name in ['RATECATEGORY', 'RATECATEGORY -Previous']:
+                    ratecat = row.get('RATECATEGORY')
+                    ratecat_prev = row.get('RATECATEGORY -Previous')
+                    if ratecat != ratecat_prev:
+                        fill = highlight_cell_fill
+                if is_highlighted:
+                    cell.font = highlight_font
+                    # The rate category highlight wins over the row highlight
+                    fill = fill or highlight_fill
+                else:
+                    cell.font = data_font
+                if fill is not None:
+                    cell.fill = fill
+                # Set number format for numeric columns
+                if col_name in numeric_cols:
+                    cell.number_format = '#,##0.00'
+
+        if not cell_highlights:
+            rule_styles = {
+                'ratecategory': (highlight_cell_fill, Font(color="000000")),
+                'row': (highlight_fill, highlight_font),
+            }
+            last_row = max(len(self.extracted_df), 1) + 1
+            for kind, first_col, last_col, formula in conditional_highlight_rules(columns, flag_col, lambda col_idx: get_column_letter(col_idx + 1)):
+                fill, font = rule_styles[kind]
+                cell_range = f"{get_column_letter(first_col + 1)}2:{get_column_letter(last_col + 1)}{last_row}"
+                ws.conditional_formatting.add(cell_range, FormulaRule(formula=[formula], fill=fill, font=font))
+
+        # --- Set Column Widths ---
+        for col_idx, col_name in enumerate(columns, 1):
+            ws.column_dimensions[get_column_letter(col_idx)].width = column_width(self.extracted_df[col_name if col_name != 'FOLIO_NO' else 'SWITCH_DETAILS_FOLIO_NO'], col_name)
+        if flag_col is not None:
+            ws.column_dimensions[get_column_letter(flag_col + 1)].width = len(self.HIGHLIGHT_FLAG_COLUMN) + 2
+            
+        # --- Add Analytics Sheet (openpyxl) ---
+        payout_cols = [col for col in self.extracted_df.columns if col.startswith('PAYOUT')]
+        scheme_type_cols = []
+        if 'Scheme Type Swith IN' in self.extracted_df.columns:
+            scheme_type_cols.append('Scheme Type Swith IN')
+        if 'Scheme Type Swith Out' in self.extracted_df.columns:
+            scheme_type_cols.append('Scheme Type Swith Out')
+        if 'SWITCH_DETAILS_FOLIO_NO' in self.extracted_df.columns:
+            analytics_df = self.extracted_df[self.extracted_df['previous < current switch in TRAIL_1ST_YEAR'] == 'check']
+            agg_dict = {
+                'TRADES_AMOUNT': 'sum',
+                'switch in TRAIL_1ST_YEAR': 'first',
+                'switch in TRAIL_1ST_YEAR -Previous': 'first',
+            }
+            for col in payout_cols:
+                agg_dict[col] = 'sum'
+            for col in scheme_type_cols:
+                agg_dict[col] = 'first'
+            analytics_summary = analytics_df.groupby(
+                ['SWITCH_DETAILS_FOLIO_NO', 'TRADES_BROK_DLR_CODE', 'switch in'], as_index=False
+            ).agg(agg_dict)
+            analytics_summary = analytics_summary.rename(columns={
+                'SWITCH_DETAILS_FOLIO_NO': 'FOLIO_NO',
+                'TRADES_BROK_DLR_CODE': 'ARN',
+                'switch in': 'Switch In Scheme Name',
+                'TRADES_AMOUNT': 'TRADES_AMOUNT(sum)',
+                'switch in TRAIL_1ST_YEAR': 'switch in TRAIL_1ST_YEAR (CURRENT)',
+                'switch in TRAIL_1ST_YEAR -Previous': 'switch in TRAIL_1ST_YEAR -Previous'
+            })
+            analytics_columns = list(analytics_summary.columns)
+        else:
+            analytics_df = self.extracted_df[self.extracted_df['previous < current switch in TRAIL_1ST_YEAR'] == 'check']
+            agg_dict = {
+                'TRADES_AMOUNT': 'sum',
+                'switch in TRAIL_1ST_YEAR': 'first',
+                'switch in TRAIL_1ST_YEAR -Previous': 'first',
+            }
+            for col in payout_cols:
+                agg_dict[col] = 'sum'
+            for col in scheme_type_cols:
+                agg_dict[col] = 'first'
+            analytics_summary = analytics_df.groupby(
+                ['TRADES_BROK_DLR_CODE', 'switch in'], as_index=False
+            ).agg(agg_dict)
+            analytics_summary = analytics_summary.rename(columns={
+                'TRADES_BROK_DLR_CODE': 'ARN',
+                'switch in': 'Switch In Scheme Name',
+                'TRADES_AMOUNT': 'TRADES_AMOUNT(sum)',
+                'switch in TRAIL_1ST_YEAR': 'switch in TRAIL_1ST_YEAR (CURRENT)',
+                'switch in TRAIL_1ST_YEAR -Previous': 'switch in TRAIL_1ST_YEAR -Previous'
+            })  
+            analytics_columns = list(analytics_summary.columns)
+        analytics_summary = analytics_summary.sort_values(by='ARN').reset_index(drop=True)
+        ws_analytics = wb.create_sheet('Analytics')
+        num_cols = len(analytics_columns)
+        # Title
+        ws_analytics.merge_cells(start_row=1, start_column=1, end_row=1, end_column=num_cols)
+        cell = ws_analytics.cell(row=1, column=1)
+        cell.value = 'Distributor wise Analytics'
+        cell.font = Font(bold=True, size=20, color='FFFFFF')
+        cell.fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
+        cell.alignment = Alignment(horizontal='center', vertical='center')
+        # Sub-header
+        ws_analytics.merge_cells(start_row=2, start_column=1, end_row=2, end_column=num_cols)
+        cell = ws_analytics.cell(row=2, column=1)
+        cell.value = 'previous < current switch in TRAIL_1ST_YEAR'
+        cell.font = Font(bold=True, size=12, color='4472C4')
+        cell.fill = PatternFill(start_color='D9E1F2', end_color='D9E1F2', fill_type='solid')
+        cell.alignment = Alignment(horizontal='center', vertical='center')
+        # Column headers
+        for col_idx, col_name in enumerate(analytics_columns, 1):
+            cell = ws_analytics.cell(row=3, column=col_idx, value=col_name)
+            cell.font = Font(bold=True, color='FFFFFF')
+            cell.fill = PatternFill(start_color='2F3E5C', end_color='2F3E5C', fill_type='solid')
+            cell.alignment = Alignment(horizontal='center', vertical='center')
+        # Data rows
+        for row_idx, row in analytics_summary.iterrows():
+            for col_idx, col_name in enumerate(analytics_columns, 1):
+                cell = ws_analytics.cell(row=row_idx + 4, column=col_idx, value=row[col_name])
+                cell.font = Font(size=10)
+                cell.alignment = Alignment(horizontal='left', vertical='center')
+                cell.border = thin_border
+        # Set column widths
+        for col_idx, col_name in enumerate(analytics_columns, 1):
+            ws_analytics.column_dimensions[get_column_letter(col_idx)].width = column_width(analytics_summary[col_name], col_name)
+
+        # --- Add Switching Rate Analytics Sheet (openpyxl) ---
+        switching_df = self.extracted_df[self.extracted_df['switching rate check'] == 'check']
+        if 'SWITCH_DETAILS_FOLIO_NO' in self.extracted_df.columns:
+            agg_dict = {
+                'TRADES_AMOUNT': 'sum',
+                'switch in TRAIL_1ST_YEAR': 'first',
+                'switch out TRAIL_1ST_YEAR': 'first',
+                'switching rate check': 'first',
+            }
+            for col in payout_cols:
+                agg_dict[col] = 'sum'
+            for col in scheme_type_cols:
+                agg_dict[col] = 'first'
+            switching_summary = switching_df.groupby(
+                ['SWITCH_DETAILS_FOLIO_NO', 'TRADES_BROK_DLR_CODE', 'switch in', 'switch out'], as_index=False
+            ).agg(agg_dict)
+            switching_summary = switching_summary.rename(columns={
+                'SWITCH_DETAILS_FOLIO_NO': 'FOLIO_NO',
+                'TRADES_BROK_DLR_CODE': 'ARN',
+                'switch in': 'Switch In Scheme Name',
+                'switch out': 'Switch OUT Scheme Name',
+                'TRADES_AMOUNT': 'TRADES_AMOUNT(sum)',
+                'switch in TRAIL_1ST_YEAR': 'switch in TRAIL_1ST_YEAR',
+                'switch out TRAIL_1ST_YEAR': 'switch OUT TRAIL_1ST_YEAR',
+                'switching rate check': 'switching rate check'
+            })
+            switching_columns = list(switching_summary.columns)
+            ws_switching = wb.create_sheet('Switching Rate Analytics')
+            num_cols = len(switching_columns)
+            ws_switching.merge_cells(start_row=1, start_column=1, end_row=1, end_column=num_cols)
+            cell = ws_switching.cell(row=1, column=1)
+            cell.value = 'Switching Rate Analytics'
+            cell.font = Font(bold=True, size=20, color='FFFFFF')
+            cell.fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
+            cell.alignment = Alignment(horizontal='center', vertical='center')
+            ws_switching.merge_cells(start_row=2, start_column=1, end_row=2, end_column=num_cols)
+            cell = ws_switching.cell(row=2, column=1)
+            cell.value = 'switch in TRAIL_1ST_YEAR > switch out TRAIL_1ST_YEAR'
+            cell.font = Font(bold=True, size=12, color='4472C4')
+            cell.fill = PatternFill(start_color='D9E1F2', end_color='D9E1F2', fill_type='solid')
+            cell.alignment = Alignment(horizontal='center', vertical='center')
+            for col_idx, col_name in enumerate(switching_columns, 1):
+                cell = ws_switching.cell(row=3, column=col_idx, value=col_name)
+                cell.font = Font(bold=True, color='FFFFFF')
+                cell.fill = PatternFill(start_color='2F3E5C', end_color='2F3E5C', fill_type='solid')
+                cell.alignment = Alignment(horizontal='center', vertical='center')
+            for row_idx, row in switching_summary.iterrows():
+                for col_idx, col_name in enumerate(switching_columns, 1):
+                    cell = ws_switching.cell(row=row_idx + 4, column=col_idx, value=row[col_name])
+                    cell.font = Font(size=10)
+                    cell.alignment = Alignment(horizontal='left', vertical='center')
+                    cell.border = thin_border
+            for col_idx, col_name in enumerate(switching_columns, 1):
+                ws_switching.column_dimensions[get_column_letter(col_idx)].width = column_width(switching_summary[col_name], col_name)
+
+        # --- Add Direct to Regular Analytics Sheet (openpyxl) ---
+        direct_df = self.extracted_df[self.extracted_df['Direct to Regular'] == 'check']
+        if 'SWITCH_DETAILS_FOLIO_NO' in self.extracted_df.columns:
+            agg_dict = {
+                'TRADES_AMOUNT': 'sum',
+            }
+            for col in payout_cols:
+                agg_dict[col] = 'sum'
+            for col in scheme_type_cols:
+                agg_dict[col] = 'first'
+            direct_summary = direct_df.groupby(
+                ['SWITCH_DETAILS_FOLIO_NO', 'TRADES_BROK_DLR_CODE', 'switch in', 'switch out'], as_index=False
+            ).agg(agg_dict)
+            direct_summary = direct_summary.rename(columns={
+                'SWITCH_DETAILS_FOLIO_NO': 'FOLIO_NO',
+                'TRADES_BROK_DLR_CODE': 'ARN',
+                'switch in': 'Switch In Scheme Name',
+                'switch out': 'Switch OUT Scheme Name',
+                'TRADES_AMOUNT': 'TRADES_AMOUNT(sum)'
+            })
+            direct_columns = list(direct_summary.columns)
+            ws_direct = wb.create_sheet('Direct to Regular Analytics')
+            num_cols = len(direct_columns)
+            ws_direct.merge_cells(start_row=1, start_column=1, end_row=1, end_column=num_cols)
+            cell = ws_direct.cell(row=1, column=1)
+            cell.value = 'Distributor wise Analytics'
+            cell.font = Font(bold=True, size=20, color='FFFFFF')
+            cell.fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
+            cell.alignment = Alignment(horizontal='center', vertical='center')
+            ws_direct.merge_cells(start_row=2, start_column=1, end_row=2, end_column=num_cols)
+            cell = ws_direct.cell(row=2, column=1)
+            cell.value = 'Direct to Regular'
+            cell.font = Font(bold=True, size=12, color='4472C4')
+            cell.fill = PatternFill(start_color='D9E1F2', end_color='D9E1F2', fill_type='solid')
+            cell.alignment = Alignment(horizontal='center', vertical='center')
+            for col_idx, col_name in enumerate(direct_columns, 1):
+                cell = ws_direct.cell(row=3, column=col_idx, value=col_name)
+                cell.font = Font(bold=True, color='FFFFFF')
+                cell.fill = PatternFill(start_color='2F3E5C', end_color='2F3E5C', fill_type='solid')
+                cell.alignment = Alignment(horizontal='center', vertical='center')
+            for row_idx, row in direct_summary.iterrows():
+                for col_idx, col_name in enumerate(direct_columns, 1):
+                    cell = ws_direct.cell(row=row_idx + 4, column=col_idx, value=row[col_name])
+                    cell.font = Font(size=10)
+                    cell.alignment = Alignment(horizontal='left', vertical='center')
+                    cell.border = thin_border
+            for col_idx, col_name in enumerate(direct_columns, 1):
+                ws_direct.column_dimensions[get_column_letter(col_idx)].width = column_width(direct_summary[col_name], col_name)
+
+        wb.save(file_path)
+
+    def _add_processing_info_sheet_xlsxwriter(self, workbook):
+        """Add a processing information sheet using xlsxwriter"""
+        worksheet = workbook.add_worksheet('Processing Information')
+        
+        # Define formats
+        title_format = workbook.add_format({
+            'bold': True,
+            'font_size': 16,
+            'fg_color': '#2c3e50',
+            'font_color': 'white',
+            'align': 'center',
+            'border': 1
+        })
+        
+        header_format = workbook.add_format({
+            'bold': True,
+            'font_size': 12,
+            'fg_color': '#34495e',
+            'font_color': 'white',
+            'border': 1,
+            'align': 'left'
+        })
+        
+        data_format = workbook.add_format({
+            'font_size': 11,
+            'border': 1,
+            'align': 'left' 
+        })
+        
+        # Title
+        worksheet.merge_range('A1:B1', 'PROCESSING INFORMATION', title_format)
+        
+        # Processing details
+        info_data = [
+            ['Input File', os.path.basename(self.input_file_path) if self.input_file_path else 'Not provided'],
+            ['Distributor Files', len(self.distributor_files)],
+            ['Previous Month Impalment Files', len(self.impalment_prev_files)],
+            ['Processing Date', pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')],
+            ['Total Columns Extracted', len(self.extracted_df.columns)],
+            ['Total Rows Processed', len(self.extracted_df)]
+        ]
+        
+        # Write processing info
+        for row_num, (key, value) in enumerate(info_data):
+            worksheet.write(row_num + 3, 0, key, header_format)
+            worksheet.write(row_num + 3, 1, value, data_format)
+        
+        # Add distributor files list if available
+        if self.distributor_files:
+            worksheet.write(len(info_data) + 5, 0, 'Distributor Files List:', header_format)
+            for i, distributor_file in enumerate(self.distributor_files):
+                worksheet.write(len(info_data) + 6 + i, 0, f'{i+1}.', data_format)
+                worksheet.write(len(info_data) + 6 + i, 1, os.path.basename(distributor_file), data_format)
+       
+        # Add previous month impalment files list if available
+        if self.impalment_prev_files:
+            worksheet.write(len(info_data) + 6 + len(self.distributor_files), 0, 'Previous Month Impalment Files List:', header_format)
+            for i, prev_file in enumerate(self.impalment_prev_files):
+                worksheet.write(len(info_data) + 7 + len(self.distributor_files) + i, 0, f'{i+1}.', data_format)
+                worksheet.write(len(info_data) + 7 + len(self.distributor_files) + i, 1, os.path.basename(prev_file), data_format)
+        
+        # Set column widths
+        worksheet.set_column('A:A', 25)
+        worksheet.set_column('B:B', 40)
+
+# Cell kinds returned by excel_cell_values
+CELL_BLANK, CELL_NUMBER, CELL_TEXT = 0, 1, 2
+
+def excel_cell_values(series, numeric=False):
+    """
+    Decide once per column how each cell is written: returns (kinds, values) arrays where kinds
+    holds CELL_BLANK / CELL_NUMBER / CELL_TEXT. Numeric columns write finite numbers as numbers
+    and anything unparseable as its text; other columns write every value as text.
+    """
+    missing = series.isna().to_numpy()
+    text = map_distinct(series, str).to_numpy(dtype=object)
+    kinds = np.where(missing, CELL_BLANK, CELL_TEXT)
+    values = text
+    if numeric:
+        numbers = pd.to_numeric(series, errors='coerce').to_numpy(dtype=float)
+        is_number = ~missing & np.isfinite(numbers)
+        kinds = np.where(is_number, CELL_NUMBER, kinds)
+        values = np.where(is_number, numbers.astype(object), text)
+    return kinds, values
+
+def rate_category_changes(extracted_df):
+    """Per-row mask of RATECATEGORY differing from RATECATEGORY -Previous (missing values never compare equal)."""
+    if 'RATECATEGORY' not in extracted_df.columns or 'RATECATEGORY -Previous' not in extracted_df.columns:
+        return np.ones(len(extracted_df), dtype=bool)
+    current = extracted_df['RATECATEGORY'].to_numpy(dtype=object)
+    previous = extracted_df['RATECATEGORY -Previous'].to_numpy(dtype=object)
+    return current != previous
+
+def conditional_highlight_rules(columns, flag_col, column_letter):
+    """
+    Conditional-format rules that reproduce the per-cell highlights of the results sheet, as
+    (kind, first column, last column) ranges over the data rows with a formula relative to
+    Excel row 2, in priority order. Columns are 0-based; column_letter maps one to its
+    spreadsheet letters (xlsxwriter's xl_col_to_name, or openpyxl's get_column_letter shifted by one). 'ratecategory' marks RATECATEGORY cells differing from
+    RATECATEGORY -Previous like rate_category_changes (case-sensitive, blanks never equal);
+    'row' marks whole rows flagged 'Y' in the HIGHLIGHT MATCH helper column at flag_col.
+    """
+    rules = []
+    ratecat_cols = [col_idx for col_idx, col in enumerate(columns) if col in ['RATECATEGORY', 'RATECATEGORY -Previous']]
+    if len(ratecat_cols) == 2:
+        current, previous = (f"${column_letter(col_idx)}2" for col_idx in ratecat_cols)
+        formula = f'OR(NOT(EXACT({current},{previous})),{current}="")'
+    else:
+        formula = 'TRUE'
+    rules.extend(('ratecategory', col_idx, col_idx, formula) for col_idx in ratecat_cols)
+    if flag_col is not None:
+        rules.append(('row', 0, flag_col, f'${column_letter(flag_col)}2="Y"'))
+    return rules
+
+def normalize_fund_name(name):
+    if not isinstance(name, str):
+        return ''
+    # Remove all non-alphanumeric characters and make lowercase
+    return re.sub(r'[^a-z0-9]', '', name.lower())
+
+def extract_core_fund_name(name):
+    """
+    Extracts the core fund name by intelligently removing plan/option suffixes.
+    Example: 'Fund Name - Direct Plan Growth' -> 'Fund Name'
+    """
+    if not isinstance(name, str):
+        return ''
+    
+    # The separator is typically ' - '
+    if ' - ' in name:
+        parts = name.split(' - ')
+        # The last part is a potential plan/option suffix
+        last_part = parts[-1].lower()
+        
+        plan_keywords = ['regular', 'direct', 'growth', 'dividend', 'idcw', 'bonus', 'plan']
+        
+        # If the last part contains any keyword, assume it's a suffix and remove it
+        if any(keyword in last_part for keyword in plan_keywords):
+            return ' - '.join(parts[:-1]).strip()
+            
+    # If no clear suffix is found, return the name as is (but stripped)
+    # This prevents incorrectly truncating names that have hyphens for other reasons.
+    return name.strip()
+
+def core_fund_key(name):
+    """Normalized core fund name used as the scheme type and trail rate lookup key."""
+    return normalize_fund_name(extract_core_fund_name(name))
+
+def normalize_colname(name):
+    return re.sub(r'\s+', '', str(name).lower())  # remove all whitespace and lowercase
+
+def find_header_row(sheet_df, required_cols, rows=range(10)):
+    norm_required = [normalize_colname(col) for col in required_cols]
+    for i in rows:
+        if i >= len(sheet_df):
+            break
+        row = [str(x).strip() if pd.notna(x) else '' for x in sheet_df.iloc[i]]
+        norm_row = [normalize_colname(col) for col in row]
+        if all(req in norm_row for req in norm_required):
+            return i
+    return None
+
+def build_agent_dimension(current_frames, previous_frames):
+    """
+    Builds one row per AGENT with its current RATECATEGORY and RATECATEGORY -Previous.
+    Frames are given in upload order; when an agent is listed more than once the first
+    entry wins. Returns (dimension or None, duplicate report), where the report has one
+    row per agent listed more than once in the current or previous files.
+    """
+    parts = []
+    reports = []
+    for source, frames, rate_col in [
+        ('current', current_frames, 'RATECATEGORY'),
+        ('previous', previous_frames, 'RATECATEGORY -Previous'),
+    ]:
+        if not frames:
+            continue
+        agents = pd.concat(frames, ignore_index=True).dropna(subset=['AGENT'])
+        duplicated = agents[agents['AGENT'].duplicated(keep=False)]
+        if not duplicated.empty:
+            report = duplicated.groupby('AGENT', sort=False)['RATECATEGORY'].agg(
+                COUNT='size',
+                RATECATEGORIES=lambda cats: ', '.join(map(str, dict.fromkeys(cats)))
+            ).reset_index()
+            report['CONFLICTING'] = duplicated.groupby('AGENT', sort=False)['RATECATEGORY'].nunique(dropna=False).values > 1
+            report.insert(0, 'SOURCE', source)
+            reports.append(report)
+        parts.append(agents.drop_duplicates('AGENT', keep='first').rename(columns={'RATECATEGORY': rate_col}))
+
+    duplicates = pd.concat(reports, ignore_index=True) if reports else pd.DataFrame(
+        columns=['SOURCE', 'AGENT', 'COUNT', 'RATECATEGORIES', 'CONFLICTING'])
+    if not parts:
+        return None, duplicates
+    agent_dim = parts[0]
+    for part in parts[1:]:
+        agent_dim = agent_dim.merge(part, on='AGENT', how='outer', validate='one_to_one')
+    return agent_dim, duplicates
+
+def read_funding_file(funding_file):
+    """
+    Returns the AgentCode / Net_Amount rows of a FundingSummary workbook.
+    The header sits on row 4, 5 or 6 and is located from the first rows; returns None if it is not found.
+    The workbook is opened once: its first rows are parsed to find the header, then only the rows
+    below it are parsed.
+    """
+    required_cols = ['AgentCode', 'Net_Amount']
+    with pd.ExcelFile(funding_file) as xls:
+        head_df = xls.parse(header=None, nrows=6)
+        header_row = find_header_row(head_df, required_cols, rows=range(3, 6))
+        if header_row is None:
+            return None
+
+        header = [normalize_colname(str(x).strip()) if pd.notna(x) else '' for x in head_df.iloc[header_row]]
+        col_positions = [header.index(normalize_colname(col)) for col in required_cols]
+        # Parse just the rows below the header and the two columns, with agent codes as text
+        fund_df = xls.parse(header=None, skiprows=header_row + 1, usecols=col_positions, dtype={col_positions[0]: str})
+    fund_df = fund_df[col_positions]
+    fund_df.columns = required_cols
+    return fund_df
+
+def find_best_sheet(rate_category, brokerage_sheets, threshold=85):
+    # Sheet keys are already clean_text'd, so an exact hit is always the best match
+    if rate_category in brokerage_sheets:
+        return rate_category
+    best_match = process.extractOne(rate_category, list(brokerage_sheets), scorer=fuzz.ratio, score_cutoff=threshold)
+    if best_match:
+        return best_match[0]
+    return None
+
+class RateCategoryResolver:
+    """
+    Resolves raw RATECATEGORY values to brokerage sheet keys, memoized per distinct category.
+    Unresolved categories are cached too, so each category is fuzzy-matched at most once per run.
+    """
+    def __init__(self, sheet_keys, threshold=85):
+        self.sheet_keys = dict.fromkeys(sheet_keys)
+        self.threshold = threshold
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+        self.exact_matches = 0
+        self.fuzzy_matches = 0
+        self.unresolved = 0
+
+    def resolve(self, rate_category_raw):
+        """Returns the matching sheet key for a rate category, or None."""
+        rate_category = clean_text(rate_category_raw)
+        if rate_category in self.cache:
+            self.hits += 1
+            return self.cache[rate_category]
+
+        self.misses += 1
+        sheet_key = find_best_sheet(rate_category, self.sheet_keys, threshold=self.threshold)
+        if sheet_key is None:
+            self.unresolved += 1
+        elif sheet_key == rate_category:
+            self.exact_matches += 1
+        else:
+            self.fuzzy_matches += 1
+        self.cache[rate_category] = sheet_key
+        return sheet_key
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'exact': self.exact_matches,
+            'fuzzy': self.fuzzy_matches,
+            'unresolved': self.unresolved,
+        }
+
+def prepare_rate_table(sheet_df):
+    """
+    Locates the header row of a raw brokerage sheet and returns its fund -> trail rows.
+    Returns a DataFrame with NORMALIZED_FUND and TRAIL_1ST_YEAR columns, or None if the
+    sheet has no recognizable header or 1st year trail column.
+    """
+    required_brokerage_cols = ['Name of the Fund', 'Trail (% p.a.) 1st year']
+    header_row = find_header_row(sheet_df, required_brokerage_cols)
+    if header_row is None:
+        return None
+
+    processed_df = sheet_df.iloc[header_row + 1:].copy()
+    processed_df.columns = [normalize_colname(col) for col in sheet_df.iloc[header_row]]
+    if 'nameofthefund' not in processed_df.columns:
+        return None
+    trail_col = next((col for col in processed_df.columns if 'trail' in col and '1st' in col and 'year' in col), None)
+    if not trail_col:
+        return None
+
+    return pd.DataFrame({
+        'NORMALIZED_FUND': map_distinct(processed_df['nameofthefund'], core_fund_key, na_value='').values,
+        'TRAIL_1ST_YEAR': processed_df[trail_col].values
+    })
+
+def read_rate_table(source, sheet_name):
+    """Parses one brokerage sheet (from a path or open ExcelFile) into its prepared rate table, or None."""
+    try:
+        return prepare_rate_table(pd.read_excel(source, sheet_name=sheet_name))
+    except Exception as e:
+        print(f"Error indexing brokerage sheet '{sheet_name}': {e}")
+        return None
+
+def parse_brokerage_sheets(sheet_tasks, workers=None, min_parallel_sheets=4):
+    """
+    Parses (file path, sheet name) tasks into rate tables, returned in task order.
+    Fans out over a process pool when there are enough sheets to be worth it; small inputs,
+    workers=1, or a pool failure fall back to parsing sequentially with one open workbook per file.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(sheet_tasks) >= min_parallel_sheets:
+        try:
+            file_paths, sheet_names = zip(*sheet_tasks)
+            with ProcessPoolExecutor(max_workers=min(workers, len(sheet_tasks))) as executor:
+                return list(executor.map(read_rate_table, file_paths, sheet_names))
+        except Exception as e:
+            print(f"Parallel brokerage parsing failed, parsing sequentially: {e}")
+
+    rate_tables = []
+    for file_path, tasks in itertools.groupby(sheet_tasks, key=lambda task: task[0]):
+        with pd.ExcelFile(file_path) as xls:
+            rate_tables.extend(read_rate_table(xls, sheet_name) for _, sheet_name in tasks)
+    return rate_tables
+
+def load_brokerage_rate_tables(file_paths, rate_categories=None, cache=None, workers=None):
+    """
+    Loads prepared rate tables for the brokerage sheets, keyed by clean_text sheet name.
+    Every sheet name is listed so rate categories resolve exactly as if all sheets were loaded,
+    but when rate_categories is given only the sheets they resolve to are parsed; the others
+    map to None. When several sheets clean to the same key, the first one in file order, then
+    sheet order, wins. Sheets found in the cache are not parsed again; the rest are parsed
+    together (see parse_brokerage_sheets) and then cached.
+    Returns (rate tables, the RateCategoryResolver over their sheet keys), so the rate categories
+    resolved here stay memoized for BrokerageRateIndex.
+    """
+    sheet_sources = {}
+    entry_dirs = {}
+    for file_path in dict.fromkeys(file_paths):
+        try:
+            entry_dir = cache.entry_dir(file_path) if cache else None
+            sheet_names = cache.load_manifest(entry_dir) if cache else None
+            if sheet_names is None:
+                with pd.ExcelFile(file_path) as xls:
+                    sheet_names = xls.sheet_names
+                if cache:
+                    cache.store_manifest(entry_dir, file_path, sheet_names)
+            entry_dirs[file_path] = entry_dir
+            for sheet_index, sheet_name in enumerate(sheet_names):
+                cleaned_sheet_name = clean_text(sheet_name)
+                if cleaned_sheet_name not in sheet_sources:
+                    sheet_sources[cleaned_sheet_name] = (file_path, sheet_index, sheet_name)
+        except Exception as e:
+            print(f"Error reading and caching file {file_path}: {e}")
+
+    resolver = RateCategoryResolver(sheet_sources)
+    if rate_categories is None:
+        needed_keys = set(sheet_sources)
+    else:
+        needed_keys = {resolver.resolve(rate_category) for rate_category in rate_categories} - {None}
+    print(f"DEBUG | Loading {len(needed_keys)} of {len(sheet_sources)} brokerage sheets")
+
+    rate_tables = dict.fromkeys(sheet_sources)
+    sheet_tasks = []
+    task_keys = []
+    for sheet_key, (file_path, sheet_index, sheet_name) in sheet_sources.items():
+        if sheet_key not in needed_keys:
+            continue
+        found, rate_table = cache.load_sheet(entry_dirs[file_path], sheet_index) if cache else (False, None)
+        if found:
+            rate_tables[sheet_key] = rate_table
+        else:
+            sheet_tasks.append((file_path, sheet_name))
+            task_keys.append(sheet_key)
+
+    for sheet_key, rate_table in zip(task_keys, parse_brokerage_sheets(sheet_tasks, workers)):
+        rate_tables[sheet_key] = rate_table
+        if cache:
+            file_path, sheet_index, _ = sheet_sources[sheet_key]
+            cache.store_sheet(entry_dirs[file_path], sheet_index, rate_table)
+    if cache:
+        cache.evict()
+    return rate_tables, resolver
+
+def file_content_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class BrokerageCache:
+    """
+    On-disk cache of parsed brokerage workbooks, keyed by the SHA-256 of the file content.
+    Each workbook gets a directory holding a manifest of its sheet names plus one pickled
+    rate table per sheet parsed so far, so a changed file simply hashes to a new entry.
+    Entries are evicted least-recently-used first once the cache grows past max_bytes.
+    Rate tables are pickled to keep their mixed-type trail values exactly, and unpickling can run
+    arbitrary code: the cache directory must only be writable by the user running the extraction
+    (it is created private), never a shared location. Pass cache=None to the loaders to skip it.
+    """
+    CACHE_VERSION = 1
+    DEFAULT_DIR = os.path.join(os.path.expanduser('~'), '.switch_extractor_cache', 'brokerage')
+    DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or self.DEFAULT_DIR
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+
+    def entry_dir(self, file_path):
+        """Returns the cache directory for the current content of a workbook."""
+        return os.path.join(self.cache_dir, f"v{self.CACHE_VERSION}-{file_content_hash(file_path)}")
+
+    def load_manifest(self, entry_dir):
+        """Returns the cached sheet names of a workbook, or None on a miss."""
+        manifest_path = os.path.join(entry_dir, 'manifest.json')
+        try:
+            with open(manifest_path, encoding='utf-8') as f:
+                sheet_names = json.load(f)['sheets']
+        except (OSError, ValueError, KeyError):
+            return None
+        # Touch the manifest so eviction sees this entry as recently used
+        os.utime(manifest_path)
+        return sheet_names
+
+    def store_manifest(self, entry_dir, file_path, sheet_names):
+        self._write(entry_dir, 'manifest.json', lambda path: self._write_json(path, {
+            'file': os.path.basename(file_path),
+            'sheets': list(sheet_names)
+        }))
+
+    def load_sheet(self, entry_dir, sheet_index):
+        """
+        Returns (found, rate table) for one cached sheet of a workbook. Anything that fails to load,
+        e.g. a pickle written by another pandas or numpy version, is a miss; the sheet is parsed
+        again and its cache file overwritten.
+        """
+        try:
+            return True, pd.read_pickle(os.path.join(entry_dir, f"sheet_{sheet_index}.pkl"))
+        except FileNotFoundError:
+            return False, None
+        except Exception as e:
+            print(f"Ignoring unreadable brokerage cache file sheet_{sheet_index}.pkl in {entry_dir}: {e}")
+            return False, None
+
+    def store_sheet(self, entry_dir, sheet_index, rate_table):
+        self._write(entry_dir, f"sheet_{sheet_index}.pkl", lambda path: pd.to_pickle(rate_table, path))
+
+    def _write_json(self, path, data):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+
+    def _write(self, entry_dir, name, writer):
+        # Write to a uniquely named temporary file and rename, so a crash never leaves a truncated
+        # entry behind and concurrent runs writing the same entry never share a temporary file
+        tmp_path = None
+        try:
+            os.makedirs(entry_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=entry_dir, prefix=f"{name}.", suffix='.tmp')
+            os.close(fd)
+            writer(tmp_path)
+            os.replace(tmp_path, os.path.join(entry_dir, name))
+            tmp_path = None
+        except OSError as e:
+            print(f"Could not write brokerage cache file {name} in {entry_dir}: {e}")
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def evict(self):
+        """Removes least-recently-used entries until the cache fits in max_bytes."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            if not os.path.isdir(entry_dir):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(entry_dir) if entry.is_file())
+            manifest_path = os.path.join(entry_dir, 'manifest.json')
+            last_used = os.path.getmtime(manifest_path) if os.path.exists(manifest_path) else 0
+            entries.append((last_used, size, entry_dir))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+
+class BrokerageRateIndex:
+    """
+    Hash index of (sheet key, normalized fund) -> 1st year trail over all loaded brokerage sheets.
+    Built from prepared rate tables (see prepare_rate_table), keyed by clean_text sheet name;
+    sheets without a usable table are kept as None so rate categories can still resolve to them.
+    Pass the resolver that load_brokerage_rate_tables returns to reuse its memoized categories.
+    """
+    def __init__(self, rate_tables, resolver=None):
+        self.resolver = resolver if resolver is not None else RateCategoryResolver(rate_tables)
+        self.rates = {}
+        for sheet_key, rate_table in rate_tables.items():
+            if rate_table is None:
+                continue
+            for fund, trail in zip(rate_table['NORMALIZED_FUND'], rate_table['TRAIL_1ST_YEAR']):
+                # Keep the first row for a fund, as the per-sheet search always did
+                self.rates.setdefault((sheet_key, fund), trail)
+
+    def resolve_sheets(self, rate_categories):
+        """Maps a Series of raw rate categories to sheet keys, resolving each distinct value once."""
+        return map_distinct(rate_categories, self.resolver.resolve)
+
+    def to_frame(self):
+        """Returns the index as a SHEET_KEY / NORMALIZED_FUND / TRAIL_1ST_YEAR table for joins."""
+        return pd.DataFrame(
+            [(sheet_key, fund, trail) for (sheet_key, fund), trail in self.rates.items()],
+            columns=['SHEET_KEY', 'NORMALIZED_FUND', 'TRAIL_1ST_YEAR'],
+            dtype=object
+        )
+
+def main(argv=None):
+    """Command-line entry point for unattended switch extraction runs."""
+    parser = argparse.ArgumentParser(description="Extract switch data and match brokerage trail rates without the GUI.")
+    parser.add_argument('input', help="Trade input file (.xlsx, .xls or .csv)")
+    parser.add_argument('-o', '--output', help="Path of the formatted .xlsx workbook to write (default: <input>_Switch_Extracted.xlsx next to the input)")
+    parser.add_argument('--export', nargs='+', default=[], choices=EXPORT_FORMATS, metavar='FORMAT',
+                        help="Also write the data and its flagged rows as parquet and/or csv next to the workbook")
+    parser.add_argument('--no-workbook', action='store_true', help="Skip the formatted workbook (use with --export)")
+    parser.add_argument('--impalment', nargs='+', default=[], metavar='FILE', help="Current month impalment file(s)")
+    parser.add_argument('--impalment-prev', nargs='+', default=[], metavar='FILE', help="Previous month impalment file(s)")
+    parser.add_argument('--funding', nargs='+', default=[], metavar='FILE', help="FundingSummary_<Month><Year> payout file(s)")
+    parser.add_argument('--scheme-master', metavar='FILE', help="Scheme Master file")
+    parser.add_argument('--brokerage', nargs='+', default=[], metavar='FILE', help="Brokerage structure workbook(s)")
+    parser.add_argument('--highlight-in', default='', help="Highlight rows whose switch in scheme contains this text")
+    parser.add_argument('--highlight-out', default='', help="Highlight rows whose switch out scheme contains this text")
+    parser.add_argument('--highlight-mode', choices=SwitchExtractionEngine.HIGHLIGHT_MODES, default='cells',
+                        help="Format highlighted cells directly, or as conditional-format rules over plain data (default: cells)")
+    parser.add_argument('--workers', type=int, default=None, help="Processes for parsing brokerage sheets (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=None, metavar='ROWS',
+                        help="Read a CSV trade file in chunks of this many rows, dropping filtered-out rows as it goes; "
+                             "the full result is still kept in memory (default: read it whole)")
+    parser.add_argument('--cache-dir', default=None, help=f"Brokerage cache directory (default: {BrokerageCache.DEFAULT_DIR})")
+    parser.add_argument('--no-cache', action='store_true', help="Parse every brokerage workbook afresh without reading or writing the cache")
+    args = parser.parse_args(argv)
+    if args.no_workbook and not args.export:
+        parser.error("--no-workbook needs at least one --export format")
+    # Exports go next to the workbook; without -o both are named after the input file
+    if args.output:
+        output_base, output_path = os.path.splitext(args.output)[0], args.output
+    else:
+        output_base = f"{os.path.splitext(args.input)[0]}_Switch_Extracted"
+        output_path = f"{output_base}.xlsx"
+
+    engine = SwitchExtractionEngine(
+        args.input,
+        distributor_files=args.impalment,
+        impalment_prev_files=args.impalment_prev,
+        funding_files=args.funding,
+        scheme_master_path=args.scheme_master,
+        brokerage_file_paths=args.brokerage,
+        highlight_in=args.highlight_in,
+        highlight_out=args.highlight_out,
+        highlight_mode=args.highlight_mode,
+        brokerage_cache_dir=args.cache_dir,
+        brokerage_cache=not args.no_cache,
+        brokerage_workers=args.workers,
+        csv_chunk_size=args.chunk_size,
+        progress=lambda value, status_text: print(f"[{value:4.0%}] {status_text}")
+    )
+    try:
+        extracted = engine.run()
+        if not args.no_workbook:
+            engine.save(output_path)
+            print(f"Extracted {len(extracted):,} rows to {output_path}")
+        if args.export:
+            for path in engine.export(output_base, args.export):
+                print(f"Exported {path}")
+    except Exception as e:
+        print(f"Error processing {args.input}: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())